@@ -3,9 +3,11 @@ import os
 from flask import Flask, render_template, redirect, url_for, flash, session, request
 from config import Config
 from models import db, bcrypt, User, App, Permission
+from migrate_db import upgrade_schema
 from core.auth import auth_bp
 from core.admin import admin_bp
 from apps.email_validator.routes import email_validator_bp
+from apps.email_validator import jobs
 from apps.text_transformer.routes import text_transformer_bp
 from functools import wraps
 
@@ -69,7 +71,7 @@ def dashboard():
 def init_db():
     """Inicializa base de dados e dados iniciais (apenas em desenvolvimento local)"""
     with app.app_context():
-        db.create_all()
+        upgrade_schema(db)
         
         # Criar apps se não existirem
         if not App.query.filter_by(name='Email Validator').first():
@@ -105,5 +107,10 @@ if __name__ == '__main__':
     if not os.environ.get('DATABASE_URL'):
         init_db()
     
+    # Fila de uploads só no processo que serve pedidos (não no do reloader);
+    # em produção arranca em gunicorn.conf.py
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        jobs.start(app)
+    
     print('🚀 MyXAPP a correr em http://localhost:5000')
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+"""python -m apps.email_validator validate entrada.csv saida.csv (ver cli.py)"""
+from .cli import main
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Arquivo de validações antigas em ficheiros frios.
+
+Os resultados de uma validação com mais de EMAIL_ARCHIVE_AFTER_DAYS passam
+para um ficheiro .ndjson.gz (uma linha JSON por email, pela ordem original)
+em EMAIL_ARCHIVE_FOLDER e saem de email_results; na BD fica só a
+EmailValidation, com os contadores, archived_at e archive_path.
+
+Durante o arquivo a validação fica com status='archiving' (reclamada com um
+UPDATE atómico, como os trabalhos de jobs.py), por isso não pode ser
+revalidada nem apagada ao mesmo tempo. archived_at é gravado quando o
+ficheiro está completo, antes de apagar as linhas; se o DELETE for
+interrompido, purge_archived apaga o que ficou na execução seguinte.
+
+EMAIL_ARCHIVE_FOLDER tem de estar num disco persistente (no Render, um disk
+montado no serviço web): o disco normal do serviço é apagado em cada deploy.
+
+api_upload_details e as exportações leem o ficheiro quando a validação está
+arquivada (ver archived_page e iter_archive_rows); sem o ficheiro (ex.:
+arquivado noutro disco) respondem 410 (ver archive_missing).
+"""
+import os
+import gzip
+import json
+from itertools import islice
+from datetime import datetime, timedelta
+from models import db, EmailValidation, EmailResult, EmailReason
+from .deletion import delete_results
+
+YIELD_PER = 2000
+
+def _archive_file(folder, validation):
+    return os.path.join(folder, f'validation_{validation.id}.ndjson.gz')
+
+def archive_validation(validation, folder, chunk_size=5000):
+    """
+    Escreve os resultados no ficheiro e apaga-os da BD (por blocos)
+    
+    Returns:
+        int: nº de linhas arquivadas, ou None se a validação estiver ocupada
+        (em processamento, a apagar ou já arquivada)
+    """
+    status = validation.status
+    claimed = EmailValidation.query.filter(
+        EmailValidation.id == validation.id,
+        EmailValidation.status.in_(('done', 'failed')),
+        EmailValidation.archived_at.is_(None)
+    ).update({'status': 'archiving', 'heartbeat_at': datetime.utcnow()},
+             synchronize_session=False)
+    db.session.commit()
+    if not claimed:
+        return None
+    
+    try:
+        return _write_archive(validation, folder, chunk_size)
+    finally:
+        db.session.rollback()
+        validation.status = status
+        db.session.commit()
+
+def _write_archive(validation, folder, chunk_size):
+    # Contadores guardados antes de as linhas saírem da BD
+    validation.counters()
+    db.session.commit()
+    
+    os.makedirs(folder, exist_ok=True)
+    path = _archive_file(folder, validation)
+    tmp_path = path + '.tmp'
+    
+    query = db.session.query(
+        EmailResult.id, EmailResult.email, EmailResult.is_valid,
+        EmailResult.is_duplicate, EmailResult.reason_code
+    ).filter(EmailResult.validation_id == validation.id)\
+     .order_by(EmailResult.id)\
+     .yield_per(YIELD_PER)
+    
+    count = 0
+    with gzip.open(tmp_path, 'wt', encoding='utf-8') as archive:
+        for row_id, email, is_valid, is_duplicate, reason_code in query:
+            archive.write(json.dumps({
+                'id': row_id,
+                'email': email,
+                'valid': is_valid,
+                'duplicate': is_duplicate,
+                'reason': EmailReason.text_for(reason_code)
+            }, ensure_ascii=False) + '\n')
+            count += 1
+    os.replace(tmp_path, path)
+    
+    validation.archived_at = datetime.utcnow()
+    validation.archive_path = path
+    db.session.commit()
+    
+    delete_results(validation.id, chunk_size)
+    return count
+
+def release_stale(lease_seconds):
+    """
+    Validações presas em 'archiving' (arquivo interrompido) há mais de
+    lease_seconds voltam a 'done' ou 'failed'
+    
+    Returns:
+        int: nº de validações libertadas
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=lease_seconds)
+    stale = EmailValidation.query.filter(
+        EmailValidation.status == 'archiving',
+        db.or_(EmailValidation.heartbeat_at.is_(None), EmailValidation.heartbeat_at < cutoff)
+    ).all()
+    for validation in stale:
+        validation.status = 'failed' if validation.error else 'done'
+    db.session.commit()
+    return len(stale)
+
+def purge_archived(chunk_size=5000):
+    """
+    Apaga as linhas que ficaram em email_results de validações já arquivadas
+    (DELETE interrompido depois de gravar archived_at)
+    
+    Returns:
+        int: nº de linhas apagadas
+    """
+    has_results = db.session.query(EmailResult.id)\
+        .filter(EmailResult.validation_id == EmailValidation.id).exists()
+    ids = [row.id for row in db.session.query(EmailValidation.id).filter(
+        EmailValidation.archived_at.isnot(None),
+        EmailValidation.status != 'archiving',
+        has_results
+    )]
+    return sum(delete_results(validation_id, chunk_size) for validation_id in ids)
+
+def archive_old(days, folder, chunk_size=5000):
+    """
+    Arquiva as validações concluídas com mais de `days` dias
+    
+    Returns:
+        list: [(validation_id, nº de linhas), ...]
+    """
+    if not days:
+        return []
+    
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    ids = [row.id for row in db.session.query(EmailValidation.id).filter(
+        EmailValidation.upload_date < cutoff,
+        EmailValidation.archived_at.is_(None),
+        EmailValidation.status.in_(('done', 'failed'))
+    ).order_by(EmailValidation.id)]
+    
+    archived = []
+    for validation_id in ids:
+        validation = db.session.get(EmailValidation, validation_id)
+        count = archive_validation(validation, folder, chunk_size)
+        if count is not None:
+            archived.append((validation_id, count))
+    return archived
+
+def archive_missing(validation):
+    """Arquivada mas sem o ficheiro neste disco?"""
+    return validation.is_archived and not os.path.exists(validation.archive_path)
+
+def iter_archive(validation):
+    """Linhas do ficheiro de arquivo (dicts id, email, valid, duplicate, reason)"""
+    with gzip.open(validation.archive_path, 'rt', encoding='utf-8') as archive:
+        for line in archive:
+            yield json.loads(line)
+
+def archived_page(validation, filter_type='all', page=1, per_page=30, after_id=None):
+    """Uma página de resultados arquivados, com os filtros de api_upload_details"""
+    rows = iter_archive(validation)
+    
+    if filter_type == 'valid':
+        rows = (row for row in rows if not row['duplicate'] and row['valid'])
+    elif filter_type == 'invalid':
+        rows = (row for row in rows if not row['duplicate'] and not row['valid'])
+    
+    if after_id is not None:
+        rows = (row for row in rows if row['id'] > after_id)
+        start = 0
+    else:
+        start = max(page - 1, 0) * per_page
+    
+    return list(islice(rows, start, start + per_page))
+
+def iter_archive_rows(validation):
+    """Linhas (email, is_valid, is_duplicate, reason) para as exportações"""
+    for row in iter_archive(validation):
+        yield row['email'], row['valid'], row['duplicate'], row['reason']
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+Lista de domínios descartáveis carregada de ficheiro.
+
+O ficheiro de texto (um domínio por linha) é compilado para um índice binário
+- uma tabela de hash (endereçamento aberto) mais os domínios - que é aberto
+com mmap. O índice é só de leitura, por isso as páginas ficam partilhadas
+entre todos os workers do gunicorn pela cache do sistema operativo.
+
+Uma consulta verifica o domínio e cada um dos seus sufixos
+(a.b.mailinator.com, b.mailinator.com, mailinator.com, com): O(nº de labels).
+O cabeçalho do índice guarda o mtime e o tamanho do ficheiro de texto de onde
+foi compilado; quando não coincidem com os atuais (ficheiro editado ou
+substituído, mesmo por um com mtime mais antigo), o índice é recompilado e
+trocado de forma atómica.
+"""
+import os
+import mmap
+import time
+import struct
+import threading
+import zlib
+from array import array
+
+MAGIC = b'MXBL2\n'
+# Magic, nº de slots, mtime e tamanho do ficheiro de texto de origem
+HEADER = struct.Struct('=6sIdQ')
+# Índice gerado localmente: slots uint32 na ordem de bytes nativa
+SLOT_TYPE = 'I'
+
+def _normalize(line):
+    line = line.split('#', 1)[0].strip().lower().rstrip('.')
+    return line or None
+
+def read_domains(path):
+    """Domínios de um ficheiro de texto (ignora linhas vazias e comentários)"""
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            domain = _normalize(line)
+            if domain:
+                yield domain
+
+def source_stamp(path):
+    """(mtime, tamanho) do ficheiro de texto, guardado no cabeçalho do índice"""
+    stat = os.stat(path)
+    return stat.st_mtime, stat.st_size
+
+def index_stamp(index_path):
+    """(mtime, tamanho) da origem de um índice existente; None se não servir"""
+    try:
+        with open(index_path, 'rb') as f:
+            magic, _, mtime, size = HEADER.unpack(f.read(HEADER.size))
+    except (OSError, struct.error):
+        return None
+    return (mtime, size) if magic == MAGIC else None
+
+def compile_index(domains, index_path, stamp=(0, 0)):
+    """
+    Escreve o índice binário: cabeçalho (com o stamp da origem), tabela de
+    slots (uint32 = offset+1 da entrada, 0 = vazio) e entradas (1 byte de
+    tamanho + domínio).
+    A escrita é feita num temporário e trocada com os.replace (atómico).
+    """
+    entries = sorted({d.encode() for d in domains if d.isascii() and len(d) < 256})
+    
+    slot_count = 1
+    while slot_count < len(entries) * 2:
+        slot_count *= 2
+    mask = slot_count - 1
+    
+    slots = array(SLOT_TYPE, bytes(4 * slot_count))
+    data = bytearray()
+    for entry in entries:
+        offset = len(data)
+        data.append(len(entry))
+        data += entry
+        i = zlib.crc32(entry) & mask
+        while slots[i]:
+            i = (i + 1) & mask
+        slots[i] = offset + 1
+    
+    tmp_path = f'{index_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, slot_count, *stamp))
+        f.write(slots.tobytes())
+        f.write(data)
+    os.replace(tmp_path, index_path)
+
+class _Index:
+    """Índice aberto (mmap) - imutável; uma recarga cria outro"""
+    
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.slot_count, _, _ = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f'Índice inválido: {path}')
+        self.mask = self.slot_count - 1
+        self.data_start = HEADER.size + 4 * self.slot_count
+        self.slots = memoryview(self.mm)[HEADER.size:self.data_start].cast(SLOT_TYPE)
+    
+    def __contains__(self, key):
+        mm = self.mm
+        slots = self.slots
+        mask = self.mask
+        i = zlib.crc32(key) & mask
+        while True:
+            slot = slots[i]
+            if not slot:
+                return False
+            start = self.data_start + slot
+            length = mm[start - 1]
+            if length == len(key) and mm[start:start + length] == key:
+                return True
+            i = (i + 1) & mask
+
+class DomainBlocklist:
+    """
+    Lista de bloqueio de domínios com correspondência de subdomínios.
+    Sem ficheiro configurado, usa os domínios passados em fallback.
+    """
+    
+    def __init__(self, fallback=(), check_interval=30):
+        self.source_path = None
+        self.index_path = None
+        self.check_interval = check_interval
+        self._fallback = frozenset(d.encode() for d in fallback)
+        self._index = None
+        self._source_stamp = None
+        self._next_check = 0
+        self._lock = threading.Lock()
+    
+    def configure(self, source_path, index_path=None, check_interval=None):
+        self.source_path = source_path
+        self.index_path = index_path or f'{source_path}.idx'
+        if check_interval is not None:
+            self.check_interval = check_interval
+        self._next_check = 0
+        self.reload()
+    
+    def reload(self):
+        """(Re)compila o índice se não for do ficheiro de texto atual e abre-o"""
+        if not self.source_path or not os.path.exists(self.source_path):
+            return
+        with self._lock:
+            stamp = source_stamp(self.source_path)
+            if stamp == self._source_stamp:
+                return
+            # Stamp lido antes dos domínios: se o ficheiro mudar a meio da
+            # compilação, a próxima verificação volta a compilar
+            if index_stamp(self.index_path) != stamp:
+                compile_index(read_domains(self.source_path), self.index_path, stamp)
+            # Troca atómica: consultas em curso continuam no índice anterior
+            self._index = _Index(self.index_path)
+            self._source_stamp = stamp
+    
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.check_interval
+        try:
+            self.reload()
+        except OSError:
+            pass
+    
+    def __contains__(self, domain):
+        if self.source_path:
+            self._maybe_reload()
+        index = self._index if self._index is not None else self._fallback
+        
+        key = domain.encode()
+        # Domínio e cada sufixo: a.b.com -> a.b.com, b.com, com
+        start = 0
+        while True:
+            if key[start:] in index:
+                return True
+            start = key.find(b'.', start) + 1
+            if not start:
+                return False
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+Validação em massa em etapas:
+
+    1. syntax_stage  - formato, descartáveis e duplicados de cada linha
+    2. resolve_stage - uma consulta MX (concorrente) por domínio distinto
+    3. join_stage    - aplica o veredicto do domínio às linhas pendentes
+"""
+import asyncio
+import dns.asyncresolver
+from .validator import check_syntax, mx_verdict
+from .cache import domain_cache
+from . import domain_store
+from .dns_scheduler import dns_scheduler
+
+DEFAULT_CONCURRENCY = 50
+
+async def query_mx_async(domain, resolver, semaphore):
+    """
+    Consulta MX assíncrona, limitada pelo semáforo (deste upload) e pelo
+    dns_scheduler (global), sem caches
+
+    Returns:
+        tuple: ((is_valid, reason), ttl em segundos)
+    """
+    async with semaphore:
+        try:
+            mx_records = await dns_scheduler.call_async(lambda: resolver.resolve(domain, 'MX'))
+        except Exception as e:
+            return mx_verdict(error=e), domain_cache.ttl_for(error=e)
+    return mx_verdict(mx_records), domain_cache.ttl_for(mx_records)
+
+async def _resolve_all(domains, concurrency):
+    resolver = dns.asyncresolver.Resolver()
+    semaphore = asyncio.Semaphore(concurrency)
+    results = await asyncio.gather(
+        *(query_mx_async(domain, resolver, semaphore) for domain in domains)
+    )
+    return dict(zip(domains, results))
+
+def syntax_stage(emails, check_mx=True, seen_emails=None):
+    """
+    Etapa 1: verificações locais e duplicados, pela ordem de entrada.
+
+    A 1ª ocorrência de cada email é validada; as seguintes ficam como
+    'Duplicado' (semântica original do api_upload). Para processar um ficheiro
+    por blocos, passa-se o mesmo seen_emails a todas as chamadas.
+
+    Returns:
+        tuple: (rows, domains) - rows são (email, is_valid, is_duplicate,
+        reason, domain), com domain preenchido apenas nas linhas que ainda
+        dependem da consulta MX; domains é o conjunto de domínios distintos
+        a resolver (ordenado pela 1ª ocorrência).
+    """
+    rows = []
+    domains = {}
+    blocked = {}  # lista de descartáveis: uma consulta por domínio do bloco
+    if seen_emails is None:
+        seen_emails = set()
+
+    for email in emails:
+        email_lower = email.lower()
+
+        # Verificar se é duplicado
+        if email_lower in seen_emails:
+            rows.append((email, False, True, 'Duplicado', None))
+            continue
+        seen_emails.add(email_lower)
+
+        is_valid, reason, domain = check_syntax(email, blocked)
+        if is_valid and check_mx:
+            domains[domain] = True
+            rows.append((email, is_valid, False, reason, domain))
+        else:
+            rows.append((email, is_valid, False, reason, None))
+
+    return rows, list(domains)
+
+def resolve_stage(domains, concurrency=DEFAULT_CONCURRENCY, refresh=(), stats=None):
+    """
+    Etapa 2: resolve cada domínio distinto uma única vez
+    (domain_cache -> domain_checks na BD -> DNS concorrente).
+    Os domínios em refresh vão sempre ao DNS. Se stats for um dict, recebe
+    cache_hits, db_hits e resolved (domínios consultados no DNS).
+
+    Returns:
+        dict: {domínio: (is_valid, reason)}
+    """
+    verdicts = {}
+    missing = []
+    forced = [domain for domain in domains if domain in refresh]
+    for domain in domains:
+        if domain in refresh:
+            continue
+        verdict = domain_cache.get(domain)
+        if verdict is None:
+            missing.append(domain)
+        else:
+            verdicts[domain] = verdict
+    cache_hits = len(verdicts)
+    db_hits = 0
+
+    if missing:
+        stored = domain_store.lookup(missing)
+        for domain, (verdict, ttl) in stored.items():
+            domain_cache.set(domain, verdict, ttl)
+            verdicts[domain] = verdict
+        missing = [domain for domain in missing if domain not in stored]
+        db_hits = len(stored)
+    missing += forced
+
+    if missing:
+        fresh = asyncio.run(_resolve_all(missing, max(1, concurrency)))
+        for domain, (verdict, ttl) in fresh.items():
+            domain_cache.set(domain, verdict, ttl)
+            verdicts[domain] = verdict
+        domain_store.store(fresh)
+
+    if stats is not None:
+        stats.update(cache_hits=cache_hits, db_hits=db_hits, resolved=missing)
+    return verdicts
+
+def join_stage(rows, verdicts):
+    """
+    Etapa 3: junta os veredictos de domínio às linhas.
+
+    Returns:
+        list: [(email, is_valid, is_duplicate, reason), ...]
+    """
+    results = []
+    for email, is_valid, is_duplicate, reason, domain in rows:
+        if domain is not None:
+            is_valid, reason = verdicts[domain]
+        results.append((email, is_valid, is_duplicate, reason))
+    return results
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Cache partilhada de veredictos MX por domínio (validação única e em massa)
+"""
+import threading
+import time
+from collections import OrderedDict
+import dns.resolver
+
+class DomainCache:
+    """
+    Cache em memória domínio -> (is_valid, reason) com expiração pelo TTL do DNS.
+
+    Respostas negativas (NXDOMAIN, NoAnswer) e falhas (timeouts, erros) também
+    ficam em cache, com TTLs próprios e mais curtos para as falhas.
+
+    Cheia, descarta o domínio usado há mais tempo (LRU, O(1)); as entradas
+    expiradas são removidas quando consultadas.
+    """
+
+    def __init__(self, max_size=100000, min_ttl=60, max_ttl=86400,
+                 negative_ttl=900, error_ttl=30):
+        self.max_size = max_size
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self.negative_ttl = negative_ttl
+        self.error_ttl = error_ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def configure(self, config):
+        """Aplica os limites definidos em config.Config"""
+        self.max_size = config.get('EMAIL_DNS_CACHE_SIZE', self.max_size)
+        self.min_ttl = config.get('EMAIL_DNS_CACHE_MIN_TTL', self.min_ttl)
+        self.max_ttl = config.get('EMAIL_DNS_CACHE_MAX_TTL', self.max_ttl)
+        self.negative_ttl = config.get('EMAIL_DNS_NEGATIVE_TTL', self.negative_ttl)
+        self.error_ttl = config.get('EMAIL_DNS_ERROR_TTL', self.error_ttl)
+
+    def ttl_for(self, mx_records=None, error=None):
+        """TTL (segundos) a aplicar a um resultado de consulta MX"""
+        if error is None:
+            try:
+                ttl = mx_records.rrset.ttl
+            except AttributeError:
+                ttl = self.min_ttl
+            return min(max(ttl, self.min_ttl), self.max_ttl)
+        if isinstance(error, (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer)):
+            return self.negative_ttl
+        return self.error_ttl
+
+    def get(self, domain):
+        """Veredicto em cache ou None (conta hit/miss)"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(domain)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(domain)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[domain]
+            self.misses += 1
+            return None
+
+    def set(self, domain, verdict, ttl):
+        if ttl <= 0:
+            return
+        expires = time.monotonic() + ttl
+        with self._lock:
+            if domain in self._entries:
+                self._entries.move_to_end(domain)
+            elif len(self._entries) >= self.max_size:
+                self._entries.popitem(last=False)
+            self._entries[domain] = (expires, verdict)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Hits, misses e nº de domínios em cache (página de tempos do admin)"""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+# Instância única partilhada por api_validate, api_upload e futuros batches
+domain_cache = DomainCache()
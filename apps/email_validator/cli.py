@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""
+Validação em massa fora da app web (ficheiros com milhões de linhas).
+
+    python -m apps.email_validator validate entrada.csv saida.csv [opções]
+
+A entrada é lida em streaming (qualquer formato de readers.py, incluindo
+.csv.gz/.zip) e processada por blocos: os duplicados são detetados no
+processo principal, as verificações locais (formato e descartáveis, as de
+validator.check_syntax) são repartidas por um ProcessPoolExecutor e as
+consultas MX são concorrentes (bulk.resolve_stage). O bloco seguinte é
+verificado nos processos enquanto o atual espera pelo DNS. A saída é um CSV
+no formato da exportação web, escrito à medida.
+
+Com --smtp, as linhas válidas passam também pela verificação RCPT TO
+(smtp_probe.py); os emails com greylisting são repetidos uma só vez no fim
+e as linhas que mudarem são reescritas no CSV. Com --user, os resultados também são gravados numa
+EmailValidation desse utilizador (aparece no histórico como um upload normal).
+"""
+import os
+import sys
+import csv
+import argparse
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from config import Config
+from models import db, User, EmailValidation
+from .validator import check_syntax, disposable_domains
+from .cache import domain_cache
+from .dns_scheduler import dns_scheduler
+from .smtp_probe import smtp_prober, probe_stage, Greylisted
+from .bulk import resolve_stage, join_stage
+from .memo import memo_stage
+from .readers import iter_file_emails, file_extension, SUPPORTED_EXTENSIONS
+from .persistence import save_results, update_verdicts
+from .exporters import iter_csv
+
+DEFAULT_CHUNK_SIZE = 10000
+
+def _config():
+    return {name: getattr(Config, name) for name in dir(Config) if name.isupper()}
+
+def _init_worker(disposable_file):
+    disposable_domains.configure(disposable_file)
+
+def _check_shard(emails):
+    blocked = {}
+    return [check_syntax(email, blocked) for email in emails]
+
+def _submit_syntax(pool, chunk, seen_emails, workers):
+    """
+    Marca os duplicados (pela ordem) e envia as verificações locais dos
+    restantes aos processos, em `workers` partes
+    
+    Returns:
+        tuple: (chunk, índices a verificar, futures)
+    """
+    pending = []
+    for index, email in enumerate(chunk):
+        email_lower = email.lower()
+        if email_lower not in seen_emails:
+            seen_emails.add(email_lower)
+            pending.append(index)
+    
+    emails = [chunk[index] for index in pending]
+    size = max(1, -(-len(emails) // workers))
+    futures = [pool.submit(_check_shard, emails[start:start + size])
+               for start in range(0, len(emails), size)]
+    return chunk, pending, futures
+
+def _syntax_rows(chunk, pending, futures, check_mx):
+    """Junta as partes nas linhas de bulk.syntax_stage: (email, is_valid, is_duplicate, reason, domain)"""
+    checks = iter([check for future in futures for check in future.result()])
+    pending = set(pending)
+    rows = []
+    domains = {}
+    for index, email in enumerate(chunk):
+        if index not in pending:
+            rows.append((email, False, True, 'Duplicado', None))
+            continue
+        is_valid, reason, domain = next(checks)
+        if is_valid and check_mx:
+            domains[domain] = True
+            rows.append((email, is_valid, False, reason, domain))
+        else:
+            rows.append((email, is_valid, False, reason, None))
+    return rows, list(domains)
+
+def _apply_greylisted(output_path, verdicts, counters):
+    """
+    Reescreve no CSV de saída as linhas válidas dos emails que o greylisting
+    deu como inexistentes (repetição no fim) e acerta os contadores
+    """
+    tmp_path = f'{output_path}.tmp'
+    with open(output_path, encoding='utf-8', newline='') as source, \
+            open(tmp_path, 'w', encoding='utf-8', newline='') as target:
+        writer = csv.writer(target)
+        for row in csv.reader(source):
+            if len(row) == 5 and row[3] == 'VÁLIDO' and row[2] in verdicts:
+                row[3], row[4] = 'INVÁLIDO', verdicts[row[2]][1]
+                counters['valid'] -= 1
+                counters['invalid'] += 1
+            writer.writerow(row)
+    os.replace(tmp_path, output_path)
+
+def _new_validation(user_email, check_mx):
+    user = User.query.filter_by(email=user_email).first()
+    if user is None:
+        raise SystemExit(f'Utilizador não encontrado: {user_email}')
+    
+    validation = EmailValidation(
+        user_id=user.id,
+        status='running',
+        check_mx=check_mx,
+        heartbeat_at=datetime.utcnow()
+    )
+    db.session.add(validation)
+    db.session.commit()
+    return validation
+
+def validate_file(input_path, output_path, check_mx=True, workers=None,
+                  concurrency=None, chunk_size=DEFAULT_CHUNK_SIZE, validation=None,
+                  smtp=False):
+    """
+    Valida um ficheiro e escreve o CSV de resultados (e a validação, se dada)
+    
+    Returns:
+        dict: contadores (total, valid, invalid, duplicate)
+    """
+    config = _config()
+    domain_cache.configure(config)
+    dns_scheduler.configure(config)
+    smtp_prober.configure(config)
+    smtp_prober.enabled = smtp or smtp_prober.enabled
+    disposable_domains.configure(config['EMAIL_DISPOSABLE_FILE'])
+    
+    workers = workers or os.cpu_count() or 1
+    concurrency = concurrency or config['EMAIL_DNS_CONCURRENCY']
+    memo_max_age = config['EMAIL_MEMO_MAX_AGE_DAYS'] if validation is not None else 0
+    upload_date = (validation.upload_date if validation is not None else datetime.utcnow())\
+        .strftime('%Y-%m-%d %H:%M:%S')
+    
+    emails = iter_file_emails(input_path, file_extension(input_path))
+    seen_emails = set()
+    greylisted = Greylisted()
+    counters = {'total': 0, 'valid': 0, 'invalid': 0, 'duplicate': 0}
+    
+    def output_rows():
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(config['EMAIL_DISPOSABLE_FILE'],)) as pool:
+            chunk = list(islice(emails, chunk_size))
+            submitted = _submit_syntax(pool, chunk, seen_emails, workers) if chunk else None
+    
+            while submitted is not None:
+                rows, domains = _syntax_rows(*submitted, check_mx)
+    
+                # Próximo bloco nos processos enquanto este vai ao DNS
+                chunk = list(islice(emails, chunk_size))
+                submitted = _submit_syntax(pool, chunk, seen_emails, workers) if chunk else None
+    
+                memo_hits = 0
+                if memo_max_age:
+                    rows, domains, memo_hits = memo_stage(rows, check_mx, memo_max_age)
+                results = join_stage(rows, resolve_stage(domains, concurrency))
+                if check_mx:
+                    results = probe_stage(results, {row[0] for row in rows if row[4] is not None},
+                                          greylisted)
+    
+                if validation is not None:
+                    save_results(validation.id, results)
+                    validation.add_counts(results)
+                    validation.memo_count = (validation.memo_count or 0) + memo_hits
+                    validation.fresh_count = (validation.fresh_count or 0) + \
+                        sum(1 for row in results if not row[2]) - memo_hits
+                    validation.processed_count = (validation.processed_count or 0) + len(results)
+                    validation.total_rows = validation.processed_count
+                    validation.heartbeat()
+                    db.session.commit()
+    
+                for email, is_valid, is_duplicate, reason in results:
+                    counters['total'] += 1
+                    if is_duplicate:
+                        counters['duplicate'] += 1
+                        tipo = 'DUPLICADO'
+                    elif is_valid:
+                        counters['valid'] += 1
+                        tipo = 'VÁLIDO'
+                    else:
+                        counters['invalid'] += 1
+                        tipo = 'INVÁLIDO'
+                    yield counters['total'], upload_date, email, tipo, reason
+    
+                print(f'... {counters["total"]} emails', file=sys.stderr)
+    
+    with open(output_path, 'w', encoding='utf-8', newline='') as output:
+        for data in iter_csv(output_rows()):
+            output.write(data)
+    
+    # Greylisting: uma só repetição, no fim (as linhas já escritas ficaram
+    # com o veredicto MX, válido; só as que passam a inválidas mudam)
+    if greylisted.emails:
+        verdicts = smtp_prober.retry_greylisted(greylisted.emails, greylisted.last_seen)
+        rejected = {email: verdict for email, verdict in verdicts.items() if not verdict[0]}
+        if rejected:
+            _apply_greylisted(output_path, rejected, counters)
+            if validation is not None:
+                update_verdicts(validation.id, rejected)
+                validation.refresh_counters()
+                db.session.commit()
+    
+    return counters
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m apps.email_validator')
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    validate = commands.add_parser('validate', help='valida um ficheiro de emails')
+    validate.add_argument('input', help=f'ficheiro de entrada ({", ".join(SUPPORTED_EXTENSIONS)})')
+    validate.add_argument('output', help='CSV de resultados')
+    validate.add_argument('--no-mx', action='store_true', help='sem verificação MX')
+    validate.add_argument('--smtp', action='store_true', help='verificar a caixa de correio (RCPT TO)')
+    validate.add_argument('--workers', type=int, help='processos para as verificações locais')
+    validate.add_argument('--concurrency', type=int, help='consultas MX em simultâneo')
+    validate.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    validate.add_argument('--user', help='gravar também numa EmailValidation deste utilizador (email)')
+    
+    args = parser.parse_args(argv)
+    
+    if file_extension(args.input) not in SUPPORTED_EXTENSIONS:
+        parser.error('Formato não suportado')
+    
+    options = dict(
+        check_mx=not args.no_mx,
+        smtp=args.smtp,
+        workers=args.workers,
+        concurrency=args.concurrency,
+        chunk_size=args.chunk_size
+    )
+    
+    if args.user:
+        # A app da web (mesma BD e configuração); a fila de trabalhos só
+        # arranca no servidor, não aqui
+        from app import app
+        with app.app_context():
+            validation = _new_validation(args.user, options['check_mx'])
+            try:
+                counters = validate_file(args.input, args.output, validation=validation, **options)
+                validation.status = 'done'
+            except BaseException as e:
+                db.session.rollback()
+                validation.status = 'failed'
+                validation.error = str(e)
+                raise
+            finally:
+                validation.finished_at = datetime.utcnow()
+                db.session.commit()
+            print(f'✅ Validação {validation.id} gravada', file=sys.stderr)
+    else:
+        counters = validate_file(args.input, args.output, **options)
+    
+    print(f"✅ {counters['total']} emails: {counters['valid']} válidos, "
+          f"{counters['invalid']} inválidos, {counters['duplicate']} duplicados", file=sys.stderr)
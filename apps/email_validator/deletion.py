@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Eliminação de validações (e de utilizadores) sem carregar linhas no ORM.
+
+As chaves estrangeiras têm ON DELETE CASCADE e as relações passive_deletes,
+por isso um DELETE do pai apaga os filhos na própria BD. Até
+EMAIL_DELETE_SYNC_MAX resultados isso acontece no pedido; acima disso a
+validação passa a status='deleting' (deixa de aparecer na app) e os
+resultados são apagados em background por blocos, com um commit por bloco,
+antes de apagar o pai (ver jobs.submit_delete); um utilizador nessa situação
+fica com pending_delete, para a eliminação ser retomada depois de um
+reinício. Os ficheiros de arquivo (archive.py) são apagados com a validação.
+"""
+import os
+from models import db, User, EmailValidation, EmailResult
+
+def delete_results(validation_id, chunk_size=5000):
+    """
+    Apaga os resultados de uma validação por blocos (uma transação por bloco)
+
+    Returns:
+        int: nº de linhas apagadas
+    """
+    table = EmailResult.__table__
+    total = 0
+    while True:
+        ids = db.select(table.c.id)\
+            .where(table.c.validation_id == validation_id)\
+            .limit(chunk_size).scalar_subquery()
+        deleted = db.session.execute(table.delete().where(table.c.id.in_(ids))).rowcount
+        db.session.commit()
+        total += deleted
+        if deleted < chunk_size:
+            return total
+
+def _remove_archives(paths):
+    for path in paths:
+        if path and os.path.exists(path):
+            os.remove(path)
+
+def _over_limit(validation_ids, sync_max):
+    """Mais de sync_max resultados? (conta no máximo sync_max + 1 linhas)"""
+    if not validation_ids:
+        return False
+    rows = db.session.query(EmailResult.id)\
+        .filter(EmailResult.validation_id.in_(validation_ids))\
+        .limit(sync_max + 1).subquery()
+    return db.session.query(db.func.count()).select_from(rows).scalar() > sync_max
+
+def delete_validation(validation, sync_max):
+    """
+    Apaga a validação no pedido ou marca-a para apagar em background
+
+    Returns:
+        bool: True se já foi apagada, False se ficou para o background, None
+        se estiver ocupada (em processamento ou a ser arquivada)
+    """
+    # Reclamada de forma atómica: não pode começar a ser arquivada a meio
+    claimed = EmailValidation.query.filter(
+        EmailValidation.id == validation.id,
+        EmailValidation.status.in_(('done', 'failed'))
+    ).update({'status': 'deleting'}, synchronize_session=False)
+    db.session.commit()
+    if not claimed:
+        return None
+    
+    if not _over_limit([validation.id], sync_max):
+        archive_path = validation.archive_path
+        db.session.delete(validation)
+        db.session.commit()
+        _remove_archives([archive_path])
+        return True
+    return False
+
+def delete_user(user, sync_max):
+    """
+    Apaga o utilizador (validações, permissões e transformações em cascata)
+    ou, se tiver mais de sync_max resultados, desativa-o e marca as
+    validações para apagar em background
+
+    Returns:
+        tuple: (apagado já?, ids das validações a apagar em background)
+    """
+    rows = db.session.query(EmailValidation.id, EmailValidation.archive_path)\
+        .filter_by(user_id=user.id).all()
+    validation_ids = [row.id for row in rows]
+    
+    if not _over_limit(validation_ids, sync_max):
+        db.session.delete(user)
+        db.session.commit()
+        _remove_archives(row.archive_path for row in rows)
+        return True, []
+    
+    user.is_active = False
+    user.pending_delete = True
+    EmailValidation.query.filter(EmailValidation.id.in_(validation_ids))\
+        .update({'status': 'deleting'}, synchronize_session=False)
+    db.session.commit()
+    return False, validation_ids
+
+def finish_delete(validation_ids, user_id=None, chunk_size=5000):
+    """Background: apaga os resultados por blocos e depois os pais"""
+    for validation_id in validation_ids:
+        delete_results(validation_id, chunk_size)
+        archive_path = db.session.query(EmailValidation.archive_path)\
+            .filter_by(id=validation_id).scalar()
+        EmailValidation.query.filter_by(id=validation_id)\
+            .delete(synchronize_session=False)
+        db.session.commit()
+        _remove_archives([archive_path])
+    
+    if user_id is not None:
+        User.query.filter_by(id=user_id).delete(synchronize_session=False)
+        db.session.commit()
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Controlo global (por processo) das consultas DNS do validador.
+
+Todas as consultas MX - validação única, uploads em background e vários
+uploads em simultâneo - passam por um único DnsScheduler, que aplica:
+
+    - um máximo de consultas em curso (max_in_flight)
+    - um ritmo máximo de consultas por segundo (token bucket, qps)
+    - novas tentativas com backoff exponencial em caso de timeout
+
+Assim, com carga, as consultas ficam mais lentas em vez de falharem com
+'Timeout ao verificar DNS' (falsos inválidos).
+"""
+import asyncio
+import random
+import threading
+import time
+import dns.resolver
+
+class DnsScheduler:
+    
+    def __init__(self, max_in_flight=100, qps=200, retries=2, backoff=0.5):
+        self.retries = retries
+        self.backoff = backoff
+        self._lock = threading.Lock()
+        self._set_limits(max_in_flight, qps)
+    
+    def _set_limits(self, max_in_flight, qps):
+        self.max_in_flight = max_in_flight
+        self.qps = qps
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        self._tokens = float(qps)
+        self._updated = time.monotonic()
+    
+    def configure(self, config):
+        """Aplica os limites definidos em config.Config"""
+        with self._lock:
+            self._set_limits(
+                config.get('EMAIL_DNS_MAX_IN_FLIGHT', self.max_in_flight),
+                config.get('EMAIL_DNS_QPS', self.qps)
+            )
+        self.retries = config.get('EMAIL_DNS_RETRIES', self.retries)
+        self.backoff = config.get('EMAIL_DNS_RETRY_BACKOFF', self.backoff)
+    
+    def _reserve(self):
+        """Reserva uma consulta no token bucket; devolve quanto tempo esperar"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.qps, self._tokens + (now - self._updated) * self.qps)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0
+            return -self._tokens / self.qps
+    
+    def _retry_delay(self, attempt):
+        return self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+    
+    def call(self, query):
+        """Executa query() (consulta bloqueante) com os limites e retries"""
+        semaphore = self._in_flight
+        for attempt in range(self.retries + 1):
+            time.sleep(self._reserve())
+            with semaphore:
+                try:
+                    return query()
+                except dns.resolver.Timeout:
+                    if attempt == self.retries:
+                        raise
+            time.sleep(self._retry_delay(attempt))
+    
+    @staticmethod
+    async def _acquire_async(semaphore):
+        """
+        Espera pelo semáforo (partilhado entre threads/event loops) numa thread
+        do executor, sem bloquear o loop; os que esperam são servidos por ordem
+        """
+        acquired = asyncio.get_running_loop().run_in_executor(None, semaphore.acquire)
+        try:
+            await asyncio.shield(acquired)
+        except asyncio.CancelledError:
+            # A thread acaba por adquirir o lugar: devolvê-lo quando o fizer
+            acquired.add_done_callback(lambda future: future.cancelled() or semaphore.release())
+            raise
+    
+    async def call_async(self, query):
+        """Como call(), para uma corrotina devolvida por query()"""
+        semaphore = self._in_flight
+        for attempt in range(self.retries + 1):
+            await asyncio.sleep(self._reserve())
+            await self._acquire_async(semaphore)
+            try:
+                return await query()
+            except dns.resolver.Timeout:
+                if attempt == self.retries:
+                    raise
+            finally:
+                semaphore.release()
+            await asyncio.sleep(self._retry_delay(attempt))
+
+# Instância única por processo
+dns_scheduler = DnsScheduler()
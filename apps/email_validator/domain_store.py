@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Veredictos MX persistidos na tabela domain_checks.
+
+Fica entre a cache em memória (cache.py) e o DNS: é consultada antes de
+resolver e atualizada depois de cada consulta, por isso sobrevive a
+reinícios e é partilhada por todos os workers. Linhas expiradas são
+ignoradas na leitura e substituídas (upsert) na consulta seguinte.
+
+Usa ligações próprias e curtas (fora da db.session) para não interferir
+com a transação do pedido/trabalho; sem app context não faz nada.
+"""
+from datetime import datetime, timedelta
+from flask import has_app_context
+from sqlalchemy.dialects import postgresql, sqlite
+from models import db, DomainCheck
+
+BATCH_SIZE = 500
+
+def _enabled():
+    return has_app_context()
+
+def lookup(domains):
+    """
+    Veredictos ainda válidos para os domínios pedidos
+
+    Returns:
+        dict: {domínio: ((is_valid, reason), ttl restante em segundos)}
+    """
+    if not _enabled():
+        return {}
+    
+    now = datetime.utcnow()
+    table = DomainCheck.__table__
+    domains = list(domains)
+    found = {}
+    
+    with db.engine.connect() as conn:
+        for start in range(0, len(domains), BATCH_SIZE):
+            batch = domains[start:start + BATCH_SIZE]
+            rows = conn.execute(
+                db.select(table.c.domain, table.c.is_valid, table.c.reason, table.c.expires_at)
+                .where(table.c.domain.in_(batch), table.c.expires_at > now)
+            )
+            for domain, is_valid, reason, expires_at in rows:
+                found[domain] = ((is_valid, reason), (expires_at - now).total_seconds())
+    
+    return found
+
+def store(results):
+    """
+    Grava/atualiza veredictos: results = {domínio: ((is_valid, reason), ttl)}
+    """
+    if not _enabled() or not results:
+        return
+    
+    now = datetime.utcnow()
+    rows = [
+        {
+            'domain': domain,
+            'is_valid': is_valid,
+            'reason': reason,
+            'checked_at': now,
+            'expires_at': now + timedelta(seconds=ttl)
+        }
+        for domain, ((is_valid, reason), ttl) in results.items()
+    ]
+    
+    dialect = postgresql if db.engine.dialect.name == 'postgresql' else sqlite
+    
+    with db.engine.begin() as conn:
+        for start in range(0, len(rows), BATCH_SIZE):
+            stmt = dialect.insert(DomainCheck.__table__).values(rows[start:start + BATCH_SIZE])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['domain'],
+                set_={
+                    'is_valid': stmt.excluded.is_valid,
+                    'reason': stmt.excluded.reason,
+                    'checked_at': stmt.excluded.checked_at,
+                    'expires_at': stmt.excluded.expires_at
+                }
+            )
+            conn.execute(stmt)
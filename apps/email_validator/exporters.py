@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Exportação em streaming dos resultados de uma validação (Excel e CSV).
+
+As linhas são lidas da BD por blocos (yield_per), ou do ficheiro de arquivo
+(archive.py), e escritas à medida: o Excel usa o modo write-only do openpyxl
+com estilos nomeados partilhados e o CSV é devolvido como gerador.
+"""
+import io
+import csv
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import NamedStyle, Font, PatternFill, Alignment
+from models import db, EmailValidation, EmailResult, EmailReason
+from .archive import iter_archive_rows
+
+HEADERS = ['ID', 'DATA DE UPLOAD', 'EMAIL', 'TIPO', 'RAZÃO']
+YIELD_PER = 2000
+
+def _db_rows(validation_id):
+    query = db.session.query(
+        EmailResult.email, EmailResult.is_valid, EmailResult.is_duplicate, EmailResult.reason_code
+    ).filter(EmailResult.validation_id == validation_id)\
+     .order_by(EmailResult.id)\
+     .yield_per(YIELD_PER)
+    
+    for email, is_valid, is_duplicate, reason_code in query:
+        yield email, is_valid, is_duplicate, EmailReason.text_for(reason_code)
+
+def iter_rows(validation_id):
+    """Linhas de exportação (id, data, email, tipo, razão) pela ordem original"""
+    validation = db.session.get(EmailValidation, validation_id)
+    
+    # A data é a do upload (igual em todas as linhas)
+    upload_date = validation.upload_date.strftime('%Y-%m-%d %H:%M:%S')
+    
+    if validation.is_archived:
+        rows = iter_archive_rows(validation)
+    else:
+        rows = _db_rows(validation_id)
+    
+    for index, (email, is_valid, is_duplicate, reason) in enumerate(rows, 1):
+        if is_duplicate:
+            tipo = 'DUPLICADO'
+        elif is_valid:
+            tipo = 'VÁLIDO'
+        else:
+            tipo = 'INVÁLIDO'
+        yield index, upload_date, email, tipo, reason
+
+def _named_styles():
+    header = NamedStyle(name='header')
+    header.font = Font(bold=True, color='FFFFFF')
+    header.fill = PatternFill(start_color='1F4788', end_color='1F4788', fill_type='solid')
+    header.alignment = Alignment(horizontal='center')
+    
+    valid = NamedStyle(name='tipo_valid')
+    valid.fill = PatternFill(start_color='C6EFCE', end_color='C6EFCE', fill_type='solid')
+    
+    invalid = NamedStyle(name='tipo_invalid')
+    invalid.fill = PatternFill(start_color='FFC7CE', end_color='FFC7CE', fill_type='solid')
+    
+    return header, valid, invalid
+
+def write_xlsx(rows, fileobj):
+    """Escreve as linhas num .xlsx (write-only) - memória constante"""
+    workbook = Workbook(write_only=True)
+    for style in _named_styles():
+        workbook.add_named_style(style)
+    
+    sheet = workbook.create_sheet('Emails')
+    
+    # Larguras
+    sheet.column_dimensions['A'].width = 8
+    sheet.column_dimensions['B'].width = 20
+    sheet.column_dimensions['C'].width = 35
+    sheet.column_dimensions['D'].width = 15
+    sheet.column_dimensions['E'].width = 40
+    
+    header_cells = []
+    for header in HEADERS:
+        cell = WriteOnlyCell(sheet, value=header)
+        cell.style = 'header'
+        header_cells.append(cell)
+    sheet.append(header_cells)
+    
+    for index, upload_date, email, tipo, reason in rows:
+        tipo_cell = WriteOnlyCell(sheet, value=tipo)
+        tipo_cell.style = 'tipo_valid' if tipo == 'VÁLIDO' else 'tipo_invalid'
+        sheet.append([index, upload_date, email, tipo_cell, reason])
+    
+    workbook.save(fileobj)
+
+def iter_csv(rows):
+    """CSV (UTF-8 com BOM, para o Excel) gerado linha a linha"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    
+    buffer.write('\ufeff')
+    writer.writerow(HEADERS)
+    
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % 1000 == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    
+    yield buffer.getvalue()
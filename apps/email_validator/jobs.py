@@ -0,0 +1,362 @@
+# -*- coding: utf-8 -*-
+"""
+Fila de trabalhos para uploads em massa (e revalidações, ver revalidate.py,
+e eliminações grandes, ver deletion.py).
+
+O estado de cada trabalho vive na própria EmailValidation (status,
+processed_count, total_rows, error, heartbeat_at), por isso não é preciso
+broker externo: cada processo do servidor web tem um pool local de threads e
+um trabalho só corre no worker que o reclamar (UPDATE ... WHERE status =
+'queued'). O pool só arranca com start(), chamado pelo servidor web
+(gunicorn.conf.py, app.py); scripts que importam a app (init_db.py,
+migrate_db.py, archive_validations.py) não reclamam trabalhos. Trabalhos
+abandonados por um worker que morreu voltam à fila no arranque e, depois,
+a cada EMAIL_JOB_SWEEP_SECONDS (_sweep_stale).
+"""
+import os
+import time
+import threading
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from models import db, User, EmailValidation
+from .bulk import syntax_stage, resolve_stage, join_stage
+from .readers import iter_file_emails, count_emails, file_extension, content_hash
+from .persistence import save_results, clone_results, update_verdicts
+from .memo import memo_stage
+from .smtp_probe import smtp_prober, probe_stage, Greylisted
+from .revalidate import revalidate_upload
+from .deletion import finish_delete, delete_results
+from .timings import StageTimings, dns_counts
+from .validator import DISPOSABLE_REASON
+
+_executor = None
+_app = None
+
+def start(app):
+    """Cria o pool de workers e retoma trabalhos em fila ou interrompidos"""
+    global _executor, _app
+    if _executor is not None:
+        return
+    _app = app
+    _executor = ThreadPoolExecutor(
+        max_workers=app.config.get('EMAIL_JOB_WORKERS', 2),
+        thread_name_prefix='email-job'
+    )
+    _executor.submit(_resume_queued)
+    threading.Thread(target=_sweep_stale, name='email-job-sweep', daemon=True).start()
+
+def submit(validation_id):
+    """Coloca uma validação (status='queued') no pool"""
+    # Sem pool neste processo: fica em fila para o próximo start()
+    if _executor is not None:
+        _executor.submit(_run, validation_id)
+
+def submit_delete(validation_ids, user_id=None):
+    """Apaga em background validações marcadas com status='deleting' (e o utilizador)"""
+    if _executor is not None:
+        _executor.submit(_delete, validation_ids, user_id)
+
+def _resume_queued():
+    with _app.app_context():
+        try:
+            _requeue_stale()
+            ids = [row.id for row in db.session.query(EmailValidation.id)
+                   .filter_by(status='queued')]
+            deleting = db.session.query(EmailValidation.id, EmailValidation.user_id)\
+                .filter_by(status='deleting').all()
+            pending_users = {row.id for row in db.session.query(User.id)
+                             .filter_by(pending_delete=True)}
+        except Exception:
+            # Tabelas ainda não criadas/atualizadas
+            return
+        finally:
+            db.session.remove()
+    for validation_id in ids:
+        submit(validation_id)
+    # Utilizadores a meio de ser apagados: as validações que faltem e o próprio
+    for user_id in pending_users:
+        submit_delete([row.id for row in deleting if row.user_id == user_id], user_id)
+    others = [row.id for row in deleting if row.user_id not in pending_users]
+    if others:
+        submit_delete(others)
+
+def _sweep_stale():
+    """
+    A cada EMAIL_JOB_SWEEP_SECONDS volta a procurar trabalhos abandonados: um
+    worker que morreu ainda está dentro do lease quando o substituto arranca
+    """
+    interval = _app.config.get('EMAIL_JOB_SWEEP_SECONDS', 60)
+    while True:
+        time.sleep(interval)
+        with _app.app_context():
+            try:
+                requeued = _requeue_stale()
+            except Exception:
+                requeued = []
+            finally:
+                db.session.remove()
+        for validation_id in requeued:
+            submit(validation_id)
+
+def _requeue_stale():
+    """
+    Trabalhos 'running' sem heartbeat dentro de EMAIL_JOB_LEASE_SECONDS voltam
+    à fila (uploads recomeçam do zero); os que não podem ser retomados (sem
+    ficheiro, ex.: CLI interrompida) ficam 'failed'
+
+    Returns:
+        list: ids que voltaram a 'queued'
+    """
+    now = datetime.utcnow()
+    cutoff = now - timedelta(seconds=_app.config.get('EMAIL_JOB_LEASE_SECONDS', 600))
+    expired = db.or_(EmailValidation.heartbeat_at.is_(None), EmailValidation.heartbeat_at < cutoff)
+    stale = [row.id for row in db.session.query(EmailValidation.id)
+             .filter(EmailValidation.status == 'running', expired)]
+    requeued = []
+    
+    for validation_id in stale:
+        # Outro processo pode estar a fazer o mesmo: só um fica com o trabalho
+        taken = EmailValidation.query.filter(
+            EmailValidation.id == validation_id,
+            EmailValidation.status == 'running',
+            expired
+        ).update({'heartbeat_at': now}, synchronize_session=False)
+        db.session.commit()
+        if not taken:
+            continue
+    
+        validation = db.session.get(EmailValidation, validation_id)
+        if validation.job_type == 'revalidate':
+            # Atualiza as linhas no sítio: basta repetir
+            validation.status = 'queued'
+        elif validation.source_path and os.path.exists(validation.source_path):
+            delete_results(validation.id, _app.config.get('EMAIL_DELETE_CHUNK_SIZE', 5000))
+            validation.count_total = validation.count_valid = None
+            validation.count_invalid = validation.count_duplicate = None
+            validation.processed_count = validation.memo_count = validation.fresh_count = 0
+            validation.timings = {name: entry for name, entry in validation.timings.items()
+                                  if name == 'upload'}
+            validation.status = 'queued'
+        else:
+            validation.status = 'failed'
+            validation.error = 'Processamento interrompido'
+            validation.finished_at = now
+        db.session.commit()
+        if validation.status == 'queued':
+            requeued.append(validation_id)
+    return requeued
+
+def _claim(validation_id):
+    """Passa o trabalho a 'running' de forma atómica; False se outro o reclamou"""
+    claimed = EmailValidation.query\
+        .filter_by(id=validation_id, status='queued')\
+        .update({'status': 'running', 'heartbeat_at': datetime.utcnow()},
+                synchronize_session=False)
+    db.session.commit()
+    return claimed == 1
+
+def _run(validation_id):
+    with _app.app_context():
+        try:
+            if not _claim(validation_id):
+                return
+            validation = db.session.get(EmailValidation, validation_id)
+            try:
+                if validation.job_type == 'revalidate':
+                    revalidate_upload(
+                        validation,
+                        chunk_size=_app.config.get('EMAIL_JOB_CHUNK_SIZE', 1000),
+                        concurrency=_app.config.get('EMAIL_DNS_CONCURRENCY', 50)
+                    )
+                elif validation.job_type == 'clone' or find_duplicate(validation):
+                    clone_upload(validation)
+                else:
+                    process_upload(validation)
+                validation.status = 'done'
+                validation.error = None
+            except Exception as e:
+                db.session.rollback()
+                validation = db.session.get(EmailValidation, validation_id)
+                if validation.job_type == 'revalidate':
+                    # Só se revalidam uploads 'done': as linhas estão todas lá
+                    validation.status = 'done'
+                    validation.refresh_counters()
+                else:
+                    validation.status = 'failed'
+                validation.error = str(e)
+            validation.finished_at = datetime.utcnow()
+            db.session.commit()
+            _remove_source(validation)
+        finally:
+            db.session.remove()
+
+def _delete(validation_ids, user_id):
+    with _app.app_context():
+        try:
+            finish_delete(
+                validation_ids, user_id,
+                chunk_size=_app.config.get('EMAIL_DELETE_CHUNK_SIZE', 5000)
+            )
+        finally:
+            db.session.remove()
+
+def _remove_source(validation):
+    if validation.source_path and os.path.exists(validation.source_path):
+        os.remove(validation.source_path)
+
+def find_duplicate(validation):
+    """
+    Hash do conteúdo normalizado (readers.content_hash, 1ª passagem que também
+    conta os emails); se o mesmo conteúdo foi validado nas últimas
+    EMAIL_DEDUP_WINDOW_HOURS, a validação passa a job_type='clone'
+    
+    Returns:
+        bool: True se os resultados podem ser copiados
+    """
+    window = _app.config.get('EMAIL_DEDUP_WINDOW_HOURS', 24)
+    if not window:
+        return False
+    
+    timings = StageTimings(validation.timings)
+    try:
+        with timings.stage('hash'):
+            upload_hash, total_rows = content_hash(
+                validation.source_path, file_extension(validation.source_path), validation.check_mx
+            )
+    except Exception as e:
+        raise ValueError(f'Erro ao ler ficheiro: {str(e)}')
+    timings.add('hash', rows=total_rows)
+    
+    source = EmailValidation.query.filter(
+        EmailValidation.id != validation.id,
+        EmailValidation.content_hash == upload_hash,
+        EmailValidation.upload_date >= datetime.utcnow() - timedelta(hours=window),
+        EmailValidation.status == 'done',
+        EmailValidation.archived_at.is_(None)
+    ).order_by(EmailValidation.upload_date.desc(), EmailValidation.id.desc()).first()
+    
+    validation.content_hash = upload_hash
+    validation.total_rows = total_rows
+    validation.timings = timings.as_dict()
+    if source is not None:
+        validation.job_type = 'clone'
+        validation.cloned_from = source.id
+    db.session.commit()
+    return source is not None
+
+def clone_upload(validation):
+    """
+    Upload repetido de um ficheiro já validado: copia os resultados da
+    validação original (INSERT ... SELECT) em vez de voltar ao DNS. Se a
+    original entretanto deixou de servir, processa o ficheiro normalmente.
+    """
+    source = db.session.get(EmailValidation, validation.cloned_from) \
+        if validation.cloned_from else None
+    if source is None or source.status != 'done' or source.is_archived:
+        validation.job_type = 'upload'
+        validation.cloned_from = None
+        return process_upload(validation)
+    
+    timings = StageTimings(validation.timings)
+    with timings.stage('clone'):
+        counters = source.counters()
+        copied = clone_results(source.id, validation.id)
+    timings.add('clone', rows=copied)
+    
+    validation.count_total = counters['total']
+    validation.count_valid = counters['valid']
+    validation.count_invalid = counters['invalid']
+    validation.count_duplicate = counters['duplicate']
+    validation.memo_count = counters['valid'] + counters['invalid']
+    validation.fresh_count = 0
+    validation.total_rows = validation.processed_count = copied
+    validation.timings = timings.as_dict()
+    db.session.commit()
+
+def process_upload(validation):
+    """
+    Lê o ficheiro da validação em streaming e processa-o por blocos, gravando
+    os resultados, o progresso (processed_count) e os tempos por etapa
+    (timings.py) no fim de cada bloco
+    """
+    started = time.perf_counter()
+    timings = StageTimings(validation.timings)
+    file_ext = file_extension(validation.source_path)
+    total_rows = validation.total_rows
+    if total_rows is None:
+        try:
+            with timings.stage('count'):
+                total_rows = count_emails(validation.source_path, file_ext)
+        except Exception as e:
+            raise ValueError(f'Erro ao ler ficheiro: {str(e)}')
+        timings.add('count', rows=total_rows)
+    
+    if not total_rows:
+        raise ValueError('Nenhum email encontrado')
+    
+    validation.total_rows = total_rows
+    db.session.commit()
+    
+    chunk_size = _app.config.get('EMAIL_JOB_CHUNK_SIZE', 1000)
+    concurrency = _app.config.get('EMAIL_DNS_CONCURRENCY', 50)
+    memo_max_age = _app.config.get('EMAIL_MEMO_MAX_AGE_DAYS', 7)
+    seen_emails = set()
+    greylisted = Greylisted()
+    emails = iter_file_emails(validation.source_path, file_ext)
+    processed = 0
+    
+    while True:
+        with timings.stage('parse'):
+            chunk = list(islice(emails, chunk_size))
+        if not chunk:
+            break
+        timings.add('parse', rows=len(chunk))
+        
+        # Etapas de bulk.py (os duplicados contam entre blocos); as linhas
+        # já validadas em uploads recentes são copiadas (memo.py)
+        with timings.stage('syntax', rows=len(chunk)):
+            rows, domains = syntax_stage(chunk, validation.check_mx, seen_emails)
+        timings.add('disposable', rows=sum(1 for row in rows if row[3] == DISPOSABLE_REASON))
+        with timings.stage('memo'):
+            rows, domains, memo_hits = memo_stage(rows, validation.check_mx, memo_max_age)
+        timings.add('memo', rows=memo_hits)
+        
+        dns_stats = {}
+        with timings.stage('dns'):
+            verdicts = resolve_stage(domains, concurrency, stats=dns_stats)
+        timings.add('dns', **dns_counts(dns_stats, verdicts))
+        results = join_stage(rows, verdicts)
+        
+        # RCPT TO opcional (smtp_probe.py) nas linhas que foram ao DNS; o
+        # greylisting é repetido no fim do trabalho, não em cada bloco
+        if validation.check_mx and smtp_prober.enabled:
+            probed = {row[0] for row in rows if row[4] is not None}
+            with timings.stage('smtp', rows=len(probed)):
+                results = probe_stage(results, probed, greylisted)
+        
+        with timings.stage('persist', rows=len(results)):
+            save_results(validation.id, results)
+            validation.add_counts(results)
+            validation.memo_count = (validation.memo_count or 0) + memo_hits
+            validation.fresh_count = (validation.fresh_count or 0) + \
+                sum(1 for row in results if not row[2]) - memo_hits
+            
+            processed += len(chunk)
+            validation.processed_count = processed
+            validation.heartbeat()
+            validation.timings = timings.as_dict()
+            db.session.commit()
+    
+    if greylisted.emails:
+        with timings.stage('smtp', greylisted=len(greylisted.emails)):
+            verdicts = smtp_prober.retry_greylisted(greylisted.emails, greylisted.last_seen)
+            update_verdicts(validation.id, verdicts)
+            validation.refresh_counters()
+            validation.heartbeat()
+            db.session.commit()
+    
+    # O persist gravado em cada bloco não inclui o próprio commit
+    timings.add('total', time.perf_counter() - started)
+    validation.timings = timings.as_dict()
+    db.session.commit()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+Reutilização de veredictos entre uploads.
+
+Cada EmailResult guarda email_hash (64 bits do SHA-1 do email em minúsculas,
+indexado). Num novo upload, as linhas que ainda dependem do DNS procuram um
+resultado recente (dentro de EMAIL_MEMO_MAX_AGE_DAYS, com o mesmo checkMX)
+e copiam-no em vez de voltar a validar. Resultados transitórios (timeouts,
+erros de DNS) não são reutilizados.
+"""
+import hashlib
+from datetime import datetime, timedelta
+from models import db, EmailValidation, EmailResult, EmailReason
+from .validator import is_transient
+
+BATCH_SIZE = 500
+
+def email_hash(email):
+    """Hash (inteiro de 64 bits com sinal) do email normalizado"""
+    digest = hashlib.sha1(email.strip().lower().encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big', signed=True)
+
+def lookup(emails, check_mx, max_age_days):
+    """
+    Veredictos recentes para os emails pedidos
+
+    Returns:
+        dict: {email em minúsculas: (is_valid, reason)}
+    """
+    if not max_age_days or not emails:
+        return {}
+    
+    cutoff = datetime.utcnow() - timedelta(days=max_age_days)
+    by_hash = {email_hash(email): email.strip().lower() for email in emails}
+    hashes = list(by_hash)
+    found = {}
+    
+    for start in range(0, len(hashes), BATCH_SIZE):
+        rows = db.session.query(
+            EmailResult.email_hash, EmailResult.email, EmailResult.is_valid, EmailResult.reason_code
+        ).join(EmailValidation, EmailValidation.id == EmailResult.validation_id)\
+         .filter(
+            EmailResult.email_hash.in_(hashes[start:start + BATCH_SIZE]),
+            EmailResult.is_duplicate == False,
+            EmailValidation.check_mx == check_mx,
+            EmailValidation.status != 'deleting',
+            EmailValidation.upload_date >= cutoff
+        ).order_by(EmailResult.id.desc())
+        
+        for hash_value, email, is_valid, reason_code in rows:
+            email_lower = by_hash[hash_value]
+            # Mais recente primeiro; confirma o email (colisões de hash)
+            if email_lower in found or email.strip().lower() != email_lower:
+                continue
+            reason = EmailReason.text_for(reason_code)
+            if is_transient(reason):
+                continue
+            found[email_lower] = (is_valid, reason)
+    
+    return found
+
+def memo_stage(rows, check_mx, max_age_days):
+    """
+    Entre syntax_stage e resolve_stage: preenche as linhas pendentes de DNS
+    com veredictos de uploads anteriores.
+
+    Returns:
+        tuple: (rows, domains, memo_hits) - domains são os domínios que
+        ainda é preciso resolver
+    """
+    pending = [row[0] for row in rows if row[4] is not None]
+    found = lookup(pending, check_mx, max_age_days)
+    
+    memo_rows = []
+    domains = {}
+    hits = 0
+    for email, is_valid, is_duplicate, reason, domain in rows:
+        if domain is not None:
+            verdict = found.get(email.strip().lower())
+            if verdict is not None:
+                is_valid, reason = verdict
+                domain = None
+                hits += 1
+            else:
+                domains[domain] = True
+        memo_rows.append((email, is_valid, is_duplicate, reason, domain))
+    
+    return memo_rows, list(domains), hits
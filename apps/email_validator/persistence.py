@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Gravação em massa de EmailResult sem o custo do ORM (unit of work).
+
+PostgreSQL: COPY FROM STDIN (psycopg2), na transação da sessão.
+Outros (SQLite): INSERT em executemany pelo SQLAlchemy Core.
+Cópia entre validações (uploads repetidos): INSERT ... SELECT.
+"""
+import io
+import csv
+from itertools import islice
+from sqlalchemy import bindparam
+from models import db, EmailResult, EmailReason
+from .memo import email_hash
+
+DEFAULT_BATCH_SIZE = 5000
+
+COLUMNS = ('validation_id', 'email', 'email_hash', 'is_valid', 'is_duplicate',
+           'score', 'reason_code')
+
+def _copy_batch(batch):
+    """COPY de um bloco de linhas (tuplos pela ordem de COLUMNS)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in batch:
+        writer.writerow(row)
+    buffer.seek(0)
+    
+    dbapi_connection = db.session.connection().connection.dbapi_connection
+    with dbapi_connection.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {EmailResult.__tablename__} ({', '.join(COLUMNS)}) "
+            "FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+
+def _insert_batch(batch):
+    """INSERT executemany de um bloco de linhas"""
+    db.session.execute(
+        EmailResult.__table__.insert(),
+        [dict(zip(COLUMNS, row)) for row in batch]
+    )
+
+def reason_codes(reasons):
+    """
+    {razão: código} para as razões dadas (textos desconhecidos ficam com o
+    código da razão genérica, ver EmailReason.normalize).
+    """
+    return {reason: EmailReason.code_for(reason) for reason in set(reasons)}
+
+def save_results(validation_id, results, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Grava resultados [(email, is_valid, is_duplicate, reason), ...] por blocos.
+    Não faz commit (fica a cargo de quem chama).
+
+    Returns:
+        int: nº de linhas gravadas
+    """
+    results = list(results)
+    codes = reason_codes(row[3] for row in results)
+    write_batch = _copy_batch if db.engine.dialect.name == 'postgresql' else _insert_batch
+    
+    rows = (
+        (validation_id, email, email_hash(email), is_valid, is_duplicate, 0, codes[reason])
+        for email, is_valid, is_duplicate, reason in results
+    )
+    
+    total = 0
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        write_batch(batch)
+        total += len(batch)
+    
+    return total
+
+def update_verdicts(validation_id, verdicts):
+    """
+    Aplica veredictos {email: (is_valid, reason)} às linhas não duplicadas
+    desses emails numa validação (UPDATE em lote pelo email_hash indexado).
+    Não faz commit.
+    """
+    if not verdicts:
+        return
+    codes = reason_codes(reason for _, reason in verdicts.values())
+    table = EmailResult.__table__
+    update = table.update()\
+        .where(table.c.validation_id == validation_id,
+               table.c.email_hash == bindparam('row_hash'),
+               table.c.email == bindparam('row_email'),
+               table.c.is_duplicate == False)\
+        .values(is_valid=bindparam('new_valid'), reason_code=bindparam('new_reason'))
+    db.session.execute(update, [
+        {'row_hash': email_hash(email), 'row_email': email,
+         'new_valid': is_valid, 'new_reason': codes[reason]}
+        for email, (is_valid, reason) in verdicts.items()
+    ])
+
+def clone_results(source_id, validation_id):
+    """
+    Copia os resultados de outra validação num único INSERT ... SELECT
+    (pela ordem original). Não faz commit.
+
+    Returns:
+        int: nº de linhas copiadas
+    """
+    table = EmailResult.__table__
+    columns = [name for name in COLUMNS if name != 'validation_id']
+    rows = db.select(db.literal(validation_id), *(table.c[name] for name in columns))\
+        .where(table.c.validation_id == source_id)\
+        .order_by(table.c.id)
+    return db.session.execute(
+        table.insert().from_select(['validation_id'] + columns, rows)
+    ).rowcount
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Leitura em streaming dos emails dos ficheiros carregados (csv, txt, xlsx e
+csv/txt comprimidos: .csv.gz, .txt.gz, .zip).
+
+Os leitores são geradores: devolvem um email de cada vez sem carregar o
+ficheiro inteiro, por isso a memória usada não depende do tamanho do ficheiro.
+Os comprimidos são descomprimidos à medida que o parser lê, sem escrever a
+versão descomprimida em disco.
+"""
+import io
+import csv
+import gzip
+import hashlib
+import zipfile
+import openpyxl
+
+SUPPORTED_EXTENSIONS = ('csv', 'txt', 'xlsx', 'xls', 'csv.gz', 'txt.gz', 'zip')
+
+def file_extension(filename):
+    """Extensão em minúsculas; 'csv.gz'/'txt.gz' contam como uma só"""
+    name = filename.lower()
+    for ext in ('csv.gz', 'txt.gz'):
+        if name.endswith('.' + ext):
+            return ext
+    return name.rsplit('.', 1)[1] if '.' in name else ''
+
+def _iter_csv(fileobj):
+    text = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+    try:
+        for row in csv.reader(text):
+            if row and row[0].strip():
+                yield row[0].strip()
+    finally:
+        text.detach()
+
+def _iter_txt(fileobj):
+    # newline='\n' - só '\n' separa linhas, como o split('\n') original
+    text = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='\n')
+    try:
+        for line in text:
+            line = line.strip()
+            if line:
+                yield line
+    finally:
+        text.detach()
+
+def _iter_xlsx(fileobj):
+    # read_only=True lê as linhas à medida, sem construir o workbook em memória
+    workbook = openpyxl.load_workbook(fileobj, read_only=True)
+    try:
+        sheet = workbook.active
+        for row in sheet.iter_rows(values_only=True):
+            if row and row[0]:
+                yield str(row[0]).strip()
+    finally:
+        workbook.close()
+
+def _iter_gzip(reader):
+    def iter_gzip(fileobj):
+        with gzip.GzipFile(fileobj=fileobj, mode='rb') as decompressed:
+            yield from reader(decompressed)
+    return iter_gzip
+
+def _iter_zip(fileobj):
+    # Todos os .csv/.txt do zip, pela ordem do arquivo, cada um em streaming
+    with zipfile.ZipFile(fileobj) as archive:
+        for member in archive.infolist():
+            name = member.filename
+            if member.is_dir() or name.startswith('__MACOSX/'):
+                continue
+            reader = {'csv': _iter_csv, 'txt': _iter_txt}.get(file_extension(name))
+            if reader is None:
+                continue
+            with archive.open(member) as decompressed:
+                yield from reader(decompressed)
+
+READERS = {
+    'csv': _iter_csv,
+    'txt': _iter_txt,
+    'xlsx': _iter_xlsx,
+    'xls': _iter_xlsx,
+    'csv.gz': _iter_gzip(_iter_csv),
+    'txt.gz': _iter_gzip(_iter_txt),
+    'zip': _iter_zip,
+}
+
+def iter_emails(fileobj, file_ext):
+    """
+    Emails (1ª coluna) de um ficheiro binário aberto, pela ordem do ficheiro
+    """
+    reader = READERS.get(file_ext)
+    if reader is None:
+        raise ValueError('Formato não suportado')
+    return reader(fileobj)
+
+def iter_file_emails(path, file_ext):
+    """Como iter_emails, a partir de um ficheiro em disco"""
+    with open(path, 'rb') as f:
+        yield from iter_emails(f, file_ext)
+
+def count_emails(path, file_ext):
+    """Nº de emails no ficheiro (1ª passagem, também em streaming)"""
+    return sum(1 for _ in iter_file_emails(path, file_ext))
+
+def content_hash(path, file_ext, check_mx):
+    """
+    Hash do conteúdo normalizado (emails extraídos, pela ordem) + checkMX:
+    o mesmo ficheiro em csv, txt ou comprimido dá o mesmo hash
+
+    Returns:
+        tuple: (sha256 em hex, nº de emails)
+    """
+    digest = hashlib.sha256(b'checkMX=1\n' if check_mx else b'checkMX=0\n')
+    count = 0
+    for email in iter_file_emails(path, file_ext):
+        digest.update(email.encode('utf-8') + b'\n')
+        count += 1
+    return digest.hexdigest(), count
+
+def save_upload(stream, path, block_size=1024 * 1024):
+    """
+    Grava o ficheiro enviado por blocos e devolve o sha256 dos bytes tal como
+    vieram (sem descomprimir nem ler emails: o hash normalizado é do worker)
+    """
+    digest = hashlib.sha256()
+    with open(path, 'wb') as output:
+        while True:
+            block = stream.read(block_size)
+            if not block:
+                break
+            digest.update(block)
+            output.write(block)
+    return digest.hexdigest()
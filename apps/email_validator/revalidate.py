@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Revalidação incremental de um upload existente.
+
+Percorre os resultados por blocos (keyset por id) e volta a juntar o
+veredicto MX do domínio de cada linha que passou nas verificações locais.
+O domínio é resolvido por resolve_stage (cache -> domain_checks -> DNS), por
+isso só há consultas DNS para domínios cujo veredicto expirou; linhas com
+falhas transitórias (timeouts, erros de DNS) são sempre consultadas de novo.
+Com a verificação SMTP ligada, as linhas com MX válido voltam ao RCPT TO
+(greylisting repetido no fim); sem nova resposta SMTP definitiva, uma linha
+'Caixa de correio não existe' mantém-se enquanto o domínio tiver MX.
+Apenas as linhas cujo veredicto mudou são atualizadas (UPDATE em lote).
+"""
+from sqlalchemy import bindparam
+from models import db, EmailResult, EmailReason
+from .persistence import reason_codes, update_verdicts
+from .bulk import resolve_stage
+from .smtp_probe import smtp_prober, Greylisted, MAILBOX_NOT_FOUND
+from .validator import check_syntax, is_transient
+
+def revalidate_upload(validation, chunk_size=1000, concurrency=50):
+    """
+    Revalida as linhas de uma validação em lote, atualiza-as no sítio e
+    recalcula os contadores.
+
+    Returns:
+        int: nº de linhas alteradas
+    """
+    table = EmailResult.__table__
+    update = table.update()\
+        .where(table.c.id == bindparam('row_id'))\
+        .values(is_valid=bindparam('new_valid'), reason_code=bindparam('new_reason'))
+    
+    validation.total_rows = validation.total_emails
+    validation.processed_count = 0
+    db.session.commit()
+    
+    last_id = 0
+    changed = 0
+    refreshed = set()  # domínios já forçados ao DNS nesta revalidação
+    greylisted = Greylisted()
+    greylisted_rows = {}  # email: (is_valid, reason_code) gravados até à repetição
+    
+    while True:
+        rows = db.session.query(
+            EmailResult.id, EmailResult.email, EmailResult.is_valid,
+            EmailResult.is_duplicate, EmailResult.reason_code
+        ).filter(
+            EmailResult.validation_id == validation.id,
+            EmailResult.id > last_id
+        ).order_by(EmailResult.id).limit(chunk_size).all()
+        
+        if not rows:
+            break
+        last_id = rows[-1].id
+        
+        # Só linhas cujo veredicto depende do DNS (passaram nas verificações locais)
+        pending = []
+        for row in rows:
+            if row.is_duplicate:
+                continue
+            is_valid, reason, domain = check_syntax(row.email)
+            if is_valid:
+                pending.append((row, domain))
+        
+        # Falhas transitórias: consultar o DNS mesmo que haja veredicto guardado
+        # (uma vez por domínio; nos blocos seguintes vale o que ficou em cache)
+        refresh = {domain for row, domain in pending
+                   if domain not in refreshed and is_transient(EmailReason.text_for(row.reason_code))}
+        refreshed |= refresh
+        verdicts = resolve_stage({domain for _, domain in pending}, concurrency, refresh=refresh)
+        
+        smtp_verdicts, deferred = {}, []
+        if smtp_prober.enabled:
+            smtp_verdicts, deferred = smtp_prober.probe(
+                row.email for row, domain in pending if verdicts[domain][0]
+            )
+            greylisted.add(deferred)
+        deferred = set(deferred)
+        codes = reason_codes(
+            [reason for _, reason in verdicts.values()] +
+            [reason for _, reason in smtp_verdicts.values()] + [MAILBOX_NOT_FOUND]
+        )
+        
+        updates = []
+        for row, domain in pending:
+            is_valid, reason = verdicts[domain]
+            if is_valid and row.email in smtp_verdicts:
+                is_valid, reason = smtp_verdicts[row.email]
+            elif is_valid and EmailReason.text_for(row.reason_code) == MAILBOX_NOT_FOUND:
+                # Sem resposta SMTP nova (desligado, greylisting, sem ligação): mantém-se
+                is_valid, reason = row.is_valid, MAILBOX_NOT_FOUND
+            if row.email in deferred:
+                greylisted_rows[row.email] = (is_valid, codes[reason])
+            if is_valid != row.is_valid or codes[reason] != row.reason_code:
+                updates.append({'row_id': row.id, 'new_valid': is_valid, 'new_reason': codes[reason]})
+        
+        if updates:
+            db.session.execute(update, updates)
+            changed += len(updates)
+        
+        validation.processed_count += len(rows)
+        validation.heartbeat()
+        db.session.commit()
+    
+    # Greylisting: uma só repetição, no fim
+    if greylisted.emails:
+        verdicts = smtp_prober.retry_greylisted(greylisted.emails, greylisted.last_seen)
+        codes = reason_codes(reason for _, reason in verdicts.values())
+        changes = {email: verdict for email, verdict in verdicts.items()
+                   if greylisted_rows[email] != (verdict[0], codes[verdict[1]])}
+        update_verdicts(validation.id, changes)
+        changed += len(changes)
+        validation.heartbeat()
+        db.session.commit()
+    
+    validation.processed_count = validation.total_rows
+    validation.refresh_counters()
+    db.session.commit()
+    return changed
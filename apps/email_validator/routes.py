@@ -1,18 +1,39 @@
 # -*- coding: utf-8 -*-
-from flask import Blueprint, render_template, request, jsonify, session, redirect, url_for, flash, send_file
-from models import db, User, Permission, App, EmailValidation, EmailResult
+from flask import Blueprint, render_template, request, jsonify, session, redirect, url_for, flash, send_file, current_app, Response, stream_with_context
+from models import db, User, Permission, App, EmailValidation, EmailResult, EmailReason
 from functools import wraps
-from datetime import datetime
-from .validator import validate_email
-import io
-import csv
+from datetime import datetime, timedelta
+from .validator import validate_email, disposable_domains
+from .cache import domain_cache
+from .dns_scheduler import dns_scheduler
+from .smtp_probe import smtp_prober
+from .readers import SUPPORTED_EXTENSIONS, file_extension, save_upload
+from .exporters import iter_rows, write_xlsx, iter_csv
+from .memo import email_hash
+from .deletion import delete_validation
+from .archive import archived_page, archive_missing
+from .timings import StageTimings
+from . import jobs
+import os
+import uuid
+import tempfile
+import time
 import json
 from werkzeug.utils import secure_filename
-import openpyxl
-from openpyxl.styles import Font, PatternFill, Alignment
 
 email_validator_bp = Blueprint('email_validator', __name__)
 
+@email_validator_bp.record_once
+def configure_email_validator(state):
+    """Aplica a configuração da app (cache, DNS, SMTP, descartáveis)"""
+    domain_cache.configure(state.app.config)
+    dns_scheduler.configure(state.app.config)
+    smtp_prober.configure(state.app.config)
+    disposable_domains.configure(
+        state.app.config['EMAIL_DISPOSABLE_FILE'],
+        check_interval=state.app.config.get('EMAIL_DISPOSABLE_RELOAD_INTERVAL')
+    )
+
 def app_permission_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -52,7 +73,11 @@ def index():
 @email_validator_bp.route('/api/validate', methods=['POST'])
 @app_permission_required
 def api_validate():
-    """Validar email único - EXATO DO ORIGINAL"""
+    """
+    Validar email único: grava-o como uma EmailValidation 'single' com um
+    EmailResult (razão codificada, ver EmailReason) e os contadores
+    preenchidos. Resposta: valid, reason e upload_id.
+    """
     data = request.get_json()
     email = data.get('email', '').strip()
     check_mx = data.get('checkMX', True)
@@ -62,10 +87,15 @@ def api_validate():
     
     # Validar email
     is_valid, reason = validate_email(email, check_mx)
+    reason_code = EmailReason.code_for(reason)
     
     # Criar upload (sessão)
     user_id = session['user_id']
-    validation = EmailValidation(user_id=user_id)
+    validation = EmailValidation(
+        user_id=user_id,
+        check_mx=bool(check_mx),
+        validation_type='single'
+    )
     db.session.add(validation)
     db.session.flush()
     
@@ -73,13 +103,15 @@ def api_validate():
     email_result = EmailResult(
         validation_id=validation.id,
         email=email,
+        email_hash=email_hash(email),
         is_valid=is_valid,
         is_duplicate=False,
         score=0,
-        reason=reason,
-        validation_type='single'
+        reason_code=reason_code
     )
     db.session.add(email_result)
+    validation.add_counts([(email, is_valid, False, reason)])
+    validation.fresh_count = 1
     db.session.commit()
     
     return jsonify({
@@ -91,7 +123,16 @@ def api_validate():
 @email_validator_bp.route('/api/upload', methods=['POST'])
 @app_permission_required
 def api_upload():
-    """Upload de ficheiro - EXATO DO ORIGINAL"""
+    """
+    Upload de ficheiro, processado em background (ver jobs.py).
+    
+    Grava o ficheiro (com o hash dos bytes) e cria uma EmailValidation
+    'queued'; o worker conta os emails e, se o mesmo conteúdo tiver sido
+    validado recentemente, copia os resultados em vez de voltar ao DNS.
+    Um reenvio do mesmo ficheiro pelo mesmo utilizador devolve o upload
+    existente (reused=true). Resposta: success, upload_id e status do
+    trabalho; o progresso vem de /api/jobs/<upload_id> (ou /events).
+    """
     if 'file' not in request.files:
         return jsonify({'error': 'Nenhum ficheiro'}), 400
     
@@ -102,236 +143,398 @@ def api_upload():
         return jsonify({'error': 'Ficheiro vazio'}), 400
     
     filename = secure_filename(file.filename)
-    file_ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
-    
-    # Ler emails do ficheiro
-    emails = []
-    
-    try:
-        if file_ext == 'csv':
-            content = file.stream.read().decode('utf-8-sig')
-            reader = csv.reader(io.StringIO(content))
-            for row in reader:
-                if row and row[0].strip():
-                    emails.append(row[0].strip())
-        
-        elif file_ext == 'txt':
-            content = file.stream.read().decode('utf-8-sig')
-            emails = [line.strip() for line in content.split('\n') if line.strip()]
-        
-        elif file_ext in ['xlsx', 'xls']:
-            workbook = openpyxl.load_workbook(file)
-            sheet = workbook.active
-            for row in sheet.iter_rows(values_only=True):
-                if row and row[0]:
-                    emails.append(str(row[0]).strip())
-        else:
-            return jsonify({'error': 'Formato não suportado'}), 400
+    file_ext = file_extension(filename)
     
-    except Exception as e:
-        return jsonify({'error': f'Erro ao ler ficheiro: {str(e)}'}), 400
+    if file_ext not in SUPPORTED_EXTENSIONS:
+        return jsonify({'error': 'Formato não suportado'}), 400
     
-    if not emails:
-        return jsonify({'error': 'Nenhum email encontrado'}), 400
+    # Guardar ficheiro para o worker (processado em background, ver jobs.py).
+    # O Werkzeug mantém corpos grandes num SpooledTemporaryFile e a cópia é
+    # feita por blocos, por isso o ficheiro nunca fica todo em memória.
+    # Os comprimidos (.gz, .zip) ficam assim e são lidos em streaming.
+    upload_folder = current_app.config['EMAIL_UPLOAD_FOLDER']
+    os.makedirs(upload_folder, exist_ok=True)
+    source_path = os.path.join(upload_folder, f'{uuid.uuid4().hex}.{file_ext}')
+    timings = StageTimings()
+    
+    # Só o hash dos bytes, ao gravar: o hash normalizado, a contagem e a
+    # cópia de um upload igual de outro utilizador ficam para o worker
+    with timings.stage('upload'):
+        file_hash = save_upload(file.stream, source_path)
     
-    # Criar upload (sessão)
     user_id = session['user_id']
-    validation = EmailValidation(user_id=user_id)
+    existing = _recent_file(user_id, file_hash, check_mx)
+    
+    # Reenvio do mesmo ficheiro pelo mesmo utilizador: devolve o upload existente
+    if existing is not None:
+        os.remove(source_path)
+        return jsonify({
+            'success': True,
+            'upload_id': existing.id,
+            'status': existing.status,
+            'reused': True
+        })
+    
+    # Criar upload (sessão)
+    validation = EmailValidation(
+        user_id=user_id,
+        status='queued',
+        check_mx=check_mx,
+        source_path=source_path,
+        file_hash=file_hash,
+        timings=timings.as_dict()
+    )
     db.session.add(validation)
-    db.session.flush()
+    db.session.commit()
     
-    # Processar emails - MANTÉM DUPLICADOS como original
-    seen_emails = {}
+    jobs.submit(validation.id)
     
-    for email in emails:
-        email_lower = email.lower()
-        
-        # Verificar se é duplicado
-        if email_lower in seen_emails:
-            # Duplicado
-            email_result = EmailResult(
-                validation_id=validation.id,
-                email=email,
-                is_valid=False,
-                is_duplicate=True,
-                score=0,
-                reason='Duplicado',
-                validation_type='bulk'
-            )
-        else:
-            # Validar
-            is_valid, reason = validate_email(email, check_mx)
-            email_result = EmailResult(
-                validation_id=validation.id,
-                email=email,
-                is_valid=is_valid,
-                is_duplicate=False,
-                score=0,
-                reason=reason,
-                validation_type='bulk'
-            )
-            seen_emails[email_lower] = True
-        
-        db.session.add(email_result)
+    return jsonify({
+        'success': True,
+        'upload_id': validation.id,
+        'status': validation.status
+    })
+
+def _recent_file(user_id, file_hash, check_mx):
+    """Upload do utilizador com os mesmos bytes e checkMX dentro de EMAIL_DEDUP_WINDOW_HOURS"""
+    window = current_app.config.get('EMAIL_DEDUP_WINDOW_HOURS', 24)
+    if not window:
+        return None
+    
+    return EmailValidation.query.filter(
+        EmailValidation.user_id == user_id,
+        EmailValidation.upload_date >= datetime.utcnow() - timedelta(hours=window),
+        EmailValidation.file_hash == file_hash,
+        EmailValidation.check_mx == check_mx,
+        EmailValidation.status.in_(('queued', 'running', 'done')),
+        EmailValidation.archived_at.is_(None)
+    ).order_by(EmailValidation.upload_date.desc(), EmailValidation.id.desc()).first()
+
+@email_validator_bp.route('/api/jobs/<int:job_id>')
+@app_permission_required
+def api_job_status(job_id):
+    """Estado de um upload em processamento"""
+    user_id = session['user_id']
     
-    db.session.commit()
+    validation = db.session.get(EmailValidation, job_id)
+    
+    if not validation or validation.user_id != user_id or validation.status == 'deleting':
+        return jsonify({'error': 'Não encontrado'}), 404
     
     return jsonify({
-        'success': True,
-        'upload_id': validation.id
+        'upload_id': validation.id,
+        'status': validation.status,
+        'processed': validation.processed_count or 0,
+        'total': validation.total_rows,
+        'memo': validation.memo_count or 0,
+        'fresh': validation.fresh_count or 0,
+        'error': validation.error
     })
 
+@email_validator_bp.route('/api/jobs/<int:job_id>/events')
+@app_permission_required
+def api_job_events(job_id):
+    """
+    Progresso de um upload em Server-Sent Events.
+    
+    Eventos: 'progress' (processed, total, valid, invalid) sempre que muda e
+    'done'/'failed' no fim. Cada ligação ocupa uma thread do worker (gthread,
+    ver render.yaml) durante no máximo EMAIL_SSE_MAX_SECONDS; o EventSource
+    volta a ligar automaticamente e continua a receber o estado atual.
+    """
+    user_id = session['user_id']
+    
+    validation = db.session.get(EmailValidation, job_id)
+    
+    if not validation or validation.user_id != user_id or validation.status == 'deleting':
+        return jsonify({'error': 'Não encontrado'}), 404
+    
+    interval = current_app.config.get('EMAIL_SSE_INTERVAL', 1)
+    max_seconds = current_app.config.get('EMAIL_SSE_MAX_SECONDS', 20)
+    
+    def sse(event, data):
+        return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+    
+    def events():
+        yield 'retry: 1000\n\n'
+        last = None
+        deadline = time.monotonic() + max_seconds
+        
+        while True:
+            # Nova leitura a cada ciclo (o worker faz commit por bloco)
+            db.session.close()
+            row = db.session.query(
+                EmailValidation.status, EmailValidation.processed_count,
+                EmailValidation.total_rows, EmailValidation.count_valid,
+                EmailValidation.count_invalid, EmailValidation.error
+            ).filter_by(id=job_id).first()
+            
+            if row is None:
+                yield sse('failed', {'error': 'Não encontrado'})
+                return
+            
+            status, processed, total, valid, invalid, error = row
+            state = {
+                'status': status,
+                'processed': processed or 0,
+                'total': total,
+                'valid': valid or 0,
+                'invalid': invalid or 0
+            }
+            
+            if state != last:
+                yield sse('progress', state)
+                last = state
+            
+            if status == 'done':
+                yield sse('done', state)
+                return
+            if status == 'failed':
+                yield sse('failed', dict(state, error=error))
+                return
+            
+            if time.monotonic() >= deadline:
+                return
+            time.sleep(interval)
+    
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @email_validator_bp.route('/api/history')
 @app_permission_required
 def api_history():
-    """Histórico - EXATO DO ORIGINAL"""
-    user_id = session['user_id']
+    """
+    Histórico paginado (mais recentes primeiro) numa única query.
     
-    validations = EmailValidation.query.filter_by(user_id=user_id)\
-        .order_by(EmailValidation.upload_date.desc())\
-        .all()
+    Parâmetros: limit (máx. 200) e before (cursor = id do último item da
+    página anterior). A resposta continua a ser uma lista; o cursor da página
+    seguinte vai no cabeçalho X-Next-Cursor.
+    """
+    user_id = session['user_id']
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+    before = request.args.get('before', type=int)
+    
+    # Contadores guardados; uploads antigos (NULL) contam em SQL
+    def stored_or_count(column, *conditions):
+        counted = db.session.query(db.func.count(EmailResult.id))\
+            .filter(EmailResult.validation_id == EmailValidation.id, *conditions)\
+            .correlate(EmailValidation).scalar_subquery()
+        return db.func.coalesce(column, counted)
+    
+    query = db.session.query(
+        EmailValidation.id,
+        EmailValidation.upload_date,
+        stored_or_count(EmailValidation.count_total),
+        stored_or_count(EmailValidation.count_valid,
+                        EmailResult.is_valid == True, EmailResult.is_duplicate == False),
+        stored_or_count(EmailValidation.count_invalid,
+                        EmailResult.is_valid == False, EmailResult.is_duplicate == False)
+    ).filter(EmailValidation.user_id == user_id, EmailValidation.status != 'deleting')
+    
+    if before:
+        cursor_date = db.session.query(EmailValidation.upload_date)\
+            .filter(EmailValidation.id == before).scalar_subquery()
+        query = query.filter(
+            db.tuple_(EmailValidation.upload_date, EmailValidation.id) < db.tuple_(cursor_date, before)
+        )
+    
+    rows = query.order_by(EmailValidation.upload_date.desc(), EmailValidation.id.desc())\
+        .limit(limit + 1).all()
     
     history = []
-    for v in validations:
+    for validation_id, upload_date, total, valid, invalid in rows[:limit]:
         history.append({
-            'id': v.id,
-            'upload_date': v.upload_date.strftime('%Y-%m-%d %H:%M:%S'),
-            'total': v.total_emails,
-            'valid': v.valid_count,
-            'invalid': v.invalid_count
+            'id': validation_id,
+            'upload_date': upload_date.strftime('%Y-%m-%d %H:%M:%S'),
+            'total': total,
+            'valid': valid,
+            'invalid': invalid
         })
     
-    return jsonify(history)
+    response = jsonify(history)
+    if len(rows) > limit:
+        response.headers['X-Next-Cursor'] = str(history[-1]['id'])
+    return response
 
 @email_validator_bp.route('/api/upload/<int:upload_id>')
 @app_permission_required
 def api_upload_details(upload_id):
-    """Detalhes de upload - EXATO DO ORIGINAL"""
+    """
+    Detalhes de um upload: contadores guardados, memo/fresh, tempos por
+    etapa (timings) e uma página de emails.
+    
+    Parâmetros: filter (all/valid/invalid), per_page e after_id (keyset: id
+    do último email da página anterior) ou page (offset). Validações
+    arquivadas são lidas do ficheiro (archive.py); sem ele, 410.
+    """
     user_id = session['user_id']
     
     validation = db.session.get(EmailValidation, upload_id)
     
-    if not validation or validation.user_id != user_id:
+    if not validation or validation.user_id != user_id or validation.status == 'deleting':
         return jsonify({'error': 'Não encontrado'}), 404
     
-    # Buscar emails com paginação
+    if archive_missing(validation):
+        return jsonify({'error': 'Ficheiro de arquivo indisponível'}), 410
+    
+    # after_id (keyset): custo constante em qualquer página; sem after_id
+    # usa page/offset como antes
     page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 30, type=int)
+    per_page = max(request.args.get('per_page', 30, type=int), 1)
     filter_type = request.args.get('filter', 'all')
+    after_id = request.args.get('after_id', type=int)
     
-    query = EmailResult.query.filter_by(validation_id=upload_id)
+    counters = validation.counters()
+    total = counters['total']
     
-    # Filtros
+    # Filtros (total pelos contadores guardados, sem COUNT(*))
     if filter_type == 'valid':
-        query = query.filter_by(is_valid=True, is_duplicate=False)
+        total = counters['valid']
     elif filter_type == 'invalid':
-        query = query.filter_by(is_valid=False, is_duplicate=False)
-    
-    query = query.order_by(EmailResult.id)
-    
-    # Paginação
-    total = query.count()
-    emails = query.limit(per_page).offset((page - 1) * per_page).all()
+        total = counters['invalid']
     
+    upload_date = validation.upload_date.strftime('%Y-%m-%d %H:%M:%S')
     results = []
-    for e in emails:
-        results.append({
-            'id': e.id,
-            'email': e.email,
-            'valid': e.is_valid,
-            'duplicate': e.is_duplicate,
-            'reason': e.reason,
-            'upload_date': e.upload_date.strftime('%Y-%m-%d %H:%M:%S')
-        })
+    
+    if validation.is_archived:
+        # Validação arquivada: lê a página do ficheiro (archive.py)
+        for row in archived_page(validation, filter_type, page, per_page, after_id):
+            results.append(dict(row, upload_date=upload_date))
+    else:
+        query = EmailResult.query.filter_by(validation_id=upload_id)
+        if filter_type == 'valid':
+            query = query.filter_by(is_duplicate=False, is_valid=True)
+        elif filter_type == 'invalid':
+            query = query.filter_by(is_duplicate=False, is_valid=False)
+        
+        query = query.order_by(EmailResult.id)
+        
+        if after_id is not None:
+            query = query.filter(EmailResult.id > after_id)
+        else:
+            query = query.offset((page - 1) * per_page)
+        
+        for e in query.limit(per_page).all():
+            results.append({
+                'id': e.id,
+                'email': e.email,
+                'valid': e.is_valid,
+                'duplicate': e.is_duplicate,
+                'reason': e.reason,
+                'upload_date': upload_date
+            })
     
     return jsonify({
         'upload_id': validation.id,
-        'upload_date': validation.upload_date.strftime('%Y-%m-%d %H:%M:%S'),
-        'total': validation.total_emails,
-        'valid': validation.valid_count,
-        'invalid': validation.invalid_count,
+        'upload_date': upload_date,
+        'total': counters['total'],
+        'valid': counters['valid'],
+        'invalid': counters['invalid'],
+        'memo': validation.memo_count or 0,
+        'fresh': validation.fresh_count or 0,
+        'timings': validation.timings,
         'emails': results,
         'pagination': {
             'page': page,
             'per_page': per_page,
             'total': total,
-            'pages': (total + per_page - 1) // per_page
+            'pages': (total + per_page - 1) // per_page,
+            'next_after_id': results[-1]['id'] if results else None
         }
     })
 
+@email_validator_bp.route('/api/upload/<int:upload_id>/revalidate', methods=['POST'])
+@app_permission_required
+def api_revalidate(upload_id):
+    """Revalidação incremental em background (só o DNS que expirou ou falhou)"""
+    user_id = session['user_id']
+    
+    validation = db.session.get(EmailValidation, upload_id)
+    
+    if not validation or validation.user_id != user_id or validation.status == 'deleting':
+        return jsonify({'error': 'Não encontrado'}), 404
+    
+    if validation.status in ('queued', 'running', 'archiving'):
+        return jsonify({'error': 'Validação em processamento'}), 409
+    
+    # Um upload que falhou só tem parte das linhas: revalidá-lo dava-o como
+    # 'done' (e copiável por find_duplicate) com resultados em falta
+    if validation.status == 'failed':
+        return jsonify({'error': 'Validação falhada'}), 400
+    
+    # Validações antigas podem ter check_mx NULL
+    if not validation.check_mx:
+        return jsonify({'error': 'Validação sem verificação MX'}), 400
+    
+    if validation.is_archived:
+        return jsonify({'error': 'Validação arquivada'}), 400
+    
+    # Reclamada de forma atómica (o arquivo pode ter começado entretanto)
+    queued = EmailValidation.query.filter(
+        EmailValidation.id == validation.id,
+        EmailValidation.status == 'done',
+        EmailValidation.check_mx.is_(True),
+        EmailValidation.archived_at.is_(None)
+    ).update({'status': 'queued', 'job_type': 'revalidate'},
+             synchronize_session=False)
+    db.session.commit()
+    if not queued:
+        return jsonify({'error': 'Validação em processamento'}), 409
+    
+    jobs.submit(validation.id)
+    
+    return jsonify({
+        'success': True,
+        'upload_id': validation.id,
+        'status': validation.status
+    })
+
 @email_validator_bp.route('/api/delete/<int:upload_id>', methods=['POST'])
 @app_permission_required
 def api_delete(upload_id):
-    """Eliminar - EXATO DO ORIGINAL"""
+    """Eliminar (ON DELETE CASCADE; uploads grandes são apagados em background)"""
     user_id = session['user_id']
     
     validation = db.session.get(EmailValidation, upload_id)
     
-    if not validation or validation.user_id != user_id:
+    if not validation or validation.user_id != user_id or validation.status == 'deleting':
         return jsonify({'error': 'Não encontrado'}), 404
     
-    db.session.delete(validation)
-    db.session.commit()
+    if validation.status in ('queued', 'running', 'archiving'):
+        return jsonify({'error': 'Validação em processamento'}), 409
+    
+    deleted = delete_validation(validation, current_app.config.get('EMAIL_DELETE_SYNC_MAX', 10000))
+    if deleted is None:
+        return jsonify({'error': 'Validação em processamento'}), 409
+    if not deleted:
+        jobs.submit_delete([upload_id])
     
     return jsonify({'success': True})
 
 @email_validator_bp.route('/export/<int:upload_id>')
 @app_permission_required
 def export_excel(upload_id):
-    """Export Excel - EXATO DO ORIGINAL"""
+    """
+    Export Excel: o openpyxl em modo write-only escreve as linhas à medida
+    (iter_rows, da BD ou do arquivo) para um ficheiro temporário, que é
+    enviado no fim; a memória não cresce com o nº de emails
+    """
     user_id = session['user_id']
     
     validation = db.session.get(EmailValidation, upload_id)
     
-    if not validation or validation.user_id != user_id:
+    if not validation or validation.user_id != user_id or validation.status == 'deleting':
         return jsonify({'error': 'Não encontrado'}), 404
     
-    emails = EmailResult.query.filter_by(validation_id=upload_id)\
-        .order_by(EmailResult.id).all()
-    
-    # Criar Excel
-    workbook = openpyxl.Workbook()
-    sheet = workbook.active
-    sheet.title = 'Emails'
-    
-    # Headers
-    headers = ['ID', 'DATA DE UPLOAD', 'EMAIL', 'TIPO', 'RAZÃO']
-    for col, header in enumerate(headers, 1):
-        cell = sheet.cell(1, col, header)
-        cell.font = Font(bold=True, color='FFFFFF')
-        cell.fill = PatternFill(start_color='1F4788', end_color='1F4788', fill_type='solid')
-        cell.alignment = Alignment(horizontal='center')
-    
-    # Data
-    for row_idx, e in enumerate(emails, 2):
-        sheet.cell(row_idx, 1, row_idx - 1)
-        sheet.cell(row_idx, 2, e.upload_date.strftime('%Y-%m-%d %H:%M:%S'))
-        sheet.cell(row_idx, 3, e.email)
-        
-        if e.is_duplicate:
-            tipo = 'DUPLICADO'
-            fill_color = 'FFC7CE'
-        elif e.is_valid:
-            tipo = 'VÁLIDO'
-            fill_color = 'C6EFCE'
-        else:
-            tipo = 'INVÁLIDO'
-            fill_color = 'FFC7CE'
-        
-        tipo_cell = sheet.cell(row_idx, 4, tipo)
-        tipo_cell.fill = PatternFill(start_color=fill_color, end_color=fill_color, fill_type='solid')
-        
-        sheet.cell(row_idx, 5, e.reason)
+    if archive_missing(validation):
+        return jsonify({'error': 'Ficheiro de arquivo indisponível'}), 410
     
-    # Larguras
-    sheet.column_dimensions['A'].width = 8
-    sheet.column_dimensions['B'].width = 20
-    sheet.column_dimensions['C'].width = 35
-    sheet.column_dimensions['D'].width = 15
-    sheet.column_dimensions['E'].width = 40
-    
-    output = io.BytesIO()
-    workbook.save(output)
+    # Excel em modo write-only num ficheiro temporário (não em memória)
+    output = tempfile.TemporaryFile()
+    write_xlsx(iter_rows(upload_id), output)
     output.seek(0)
     
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
@@ -343,6 +546,28 @@ def export_excel(upload_id):
         download_name=f'emails_{timestamp}.xlsx'
     )
 
+@email_validator_bp.route('/export/<int:upload_id>/csv')
+@app_permission_required
+def export_csv(upload_id):
+    """Export CSV em streaming (começa a descarregar de imediato)"""
+    user_id = session['user_id']
+    
+    validation = db.session.get(EmailValidation, upload_id)
+    
+    if not validation or validation.user_id != user_id or validation.status == 'deleting':
+        return jsonify({'error': 'Não encontrado'}), 404
+    
+    if archive_missing(validation):
+        return jsonify({'error': 'Ficheiro de arquivo indisponível'}), 410
+    
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    
+    return Response(
+        stream_with_context(iter_csv(iter_rows(upload_id))),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename=emails_{timestamp}.csv'}
+    )
+
 @email_validator_bp.route('/details')
 @app_permission_required
 def details():
@@ -356,7 +581,7 @@ def details():
     user_id = session['user_id']
     validation = db.session.get(EmailValidation, upload_id)
     
-    if not validation or validation.user_id != user_id:
+    if not validation or validation.user_id != user_id or validation.status == 'deleting':
         flash('Validação não encontrada', 'danger')
         return redirect(url_for('email_validator.index'))
     
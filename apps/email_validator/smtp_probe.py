@@ -0,0 +1,376 @@
+# -*- coding: utf-8 -*-
+"""
+Verificação opcional da caixa de correio por SMTP (RCPT TO), depois do MX.
+
+Os emails são agrupados pelo servidor MX do domínio (o de menor
+preferência). As ligações vivem num event loop próprio (uma thread por
+processo) e ficam num pool por servidor: no máximo max_sessions abertas em
+todo o processo, seja qual for o nº de blocos e de trabalhos em curso, e
+reutilizadas entre chamadas a probe() até ficarem idle_timeout segundos sem
+uso. Cada ligação serve muitos destinatários (um MAIL FROM e vários RCPT TO,
+com RSET a cada rcpt_per_session), por isso 10k emails do mesmo domínio usam
+poucas sessões SMTP. Nenhuma mensagem é enviada (não há DATA).
+
+Respostas:
+
+    - 2xx         -> válido
+    - 550/551/553 -> 'Caixa de correio não existe'
+    - 4xx         -> greylisting: repete depois de greylist_delay segundos,
+                     até greylist_retries vezes (retry_greylisted); nos
+                     trabalhos em background, uma só vez no fim do trabalho
+                     (Greylisted), para não parar cada bloco. Sem resposta
+                     definitiva o veredicto MX mantém-se
+    - outras / falhas de ligação -> veredicto MX mantém-se
+
+Desligado por omissão (EMAIL_SMTP_PROBE). EMAIL_SMTP_HOST/EMAIL_SMTP_PORT
+forçam todas as ligações para um servidor fixo, por exemplo um aiosmtpd
+local para testes (ver tests/test_smtp_probe.py).
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+import dns.asyncresolver
+from .dns_scheduler import dns_scheduler
+
+MAILBOX_NOT_FOUND = 'Caixa de correio não existe'
+NOT_FOUND_CODES = (550, 551, 553)
+
+class SmtpError(Exception):
+    pass
+
+# Falhas de ligação/protocolo: os emails ficam com o veredicto MX
+CONNECTION_ERRORS = (OSError, asyncio.TimeoutError, SmtpError, ValueError)
+
+class _Session:
+    """Uma ligação SMTP reutilizada para vários RCPT TO"""
+    
+    def __init__(self, prober):
+        self.prober = prober
+        self.reader = None
+        self.writer = None
+        self.in_transaction = False
+        self.recipients = 0
+        self.reused = False
+        self.last_used = 0
+    
+    async def open(self, host, port):
+        timeout = self.prober.timeout
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port), timeout
+        )
+        code, _ = await asyncio.wait_for(self._reply(), timeout)
+        if code != 220:
+            raise SmtpError(f'Saudação SMTP {code}')
+        code, _ = await self.command(f'EHLO {self.prober.helo}')
+        if code != 250:
+            code, _ = await self.command(f'HELO {self.prober.helo}')
+            if code != 250:
+                raise SmtpError(f'HELO recusado ({code})')
+        with self.prober._lock:
+            self.prober.sessions += 1
+    
+    async def _reply(self):
+        lines = []
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                raise SmtpError('Ligação fechada pelo servidor')
+            line = line.decode('utf-8', 'replace').rstrip('\r\n')
+            lines.append(line[4:])
+            if line[3:4] != '-':
+                return int(line[:3]), '\n'.join(lines)
+    
+    async def command(self, line):
+        self.writer.write((line + '\r\n').encode('utf-8'))
+        await self.writer.drain()
+        return await asyncio.wait_for(self._reply(), self.prober.timeout)
+    
+    async def rcpt(self, email):
+        """Código de resposta ao RCPT TO (abre a transação se preciso)"""
+        if self.recipients >= self.prober.rcpt_per_session:
+            await self.command('RSET')
+            self.in_transaction = False
+            self.recipients = 0
+    
+        if not self.in_transaction:
+            code, _ = await self.command(f'MAIL FROM:<{self.prober.mail_from}>')
+            if code != 250:
+                raise SmtpError(f'MAIL FROM recusado ({code})')
+            self.in_transaction = True
+    
+        code, _ = await self.command(f'RCPT TO:<{email}>')
+        self.recipients += 1
+        return code
+    
+    async def close(self):
+        if self.writer is None:
+            return
+        try:
+            await self.command('QUIT')
+        except Exception:
+            pass
+        self.writer.close()
+        self.writer = None
+
+class _HostPool:
+    """Sessões abertas para um servidor, partilhadas por todas as chamadas do processo"""
+    
+    def __init__(self, prober, host):
+        self.prober = prober
+        self.host = host
+        self.slots = asyncio.Semaphore(prober.max_sessions)
+        self.idle = []
+        self.clients = 0  # chamadas de _probe_host a usar o pool
+    
+    async def acquire(self):
+        """Sessão livre (reutilizada ou nova); espera se já houver max_sessions em uso"""
+        await self.slots.acquire()
+        if self.idle:
+            session = self.idle.pop()
+            session.reused = True
+        else:
+            session = _Session(self.prober)
+            try:
+                await session.open(self.host, self.prober.port)
+            except BaseException:
+                await session.close()
+                self.slots.release()
+                raise
+        return session
+    
+    async def release(self, session, reusable=True):
+        if reusable:
+            session.last_used = asyncio.get_running_loop().time()
+            self.idle.append(session)
+        else:
+            await session.close()
+        self.slots.release()
+    
+    async def close_idle(self, max_idle):
+        """Fecha as sessões paradas há mais de max_idle segundos"""
+        now = asyncio.get_running_loop().time()
+        expired = [session for session in self.idle if now - session.last_used > max_idle]
+        self.idle = [session for session in self.idle if now - session.last_used <= max_idle]
+        for session in expired:
+            await session.close()
+
+class SmtpProber:
+
+    def __init__(self, enabled=False, host=None, port=25, helo='localhost',
+                 mail_from='', timeout=10, max_sessions=2, rcpt_per_session=100,
+                 greylist_retries=2, greylist_delay=30, idle_timeout=30):
+        self.enabled = enabled
+        self.host = host
+        self.port = port
+        self.helo = helo
+        self.mail_from = mail_from
+        self.timeout = timeout
+        self.max_sessions = max_sessions
+        self.rcpt_per_session = rcpt_per_session
+        self.greylist_retries = greylist_retries
+        self.greylist_delay = greylist_delay
+        self.idle_timeout = idle_timeout
+        self.sessions = 0
+        self._lock = threading.Lock()
+        self._loop = None
+        self._pools = {}
+    
+    def configure(self, config):
+        """Aplica as opções EMAIL_SMTP_* de config.Config"""
+        self.enabled = config.get('EMAIL_SMTP_PROBE', self.enabled)
+        self.host = config.get('EMAIL_SMTP_HOST', self.host)
+        self.port = config.get('EMAIL_SMTP_PORT', self.port)
+        self.helo = config.get('EMAIL_SMTP_HELO', self.helo)
+        self.mail_from = config.get('EMAIL_SMTP_MAIL_FROM', self.mail_from)
+        self.timeout = config.get('EMAIL_SMTP_TIMEOUT', self.timeout)
+        self.max_sessions = config.get('EMAIL_SMTP_MAX_SESSIONS_PER_HOST', self.max_sessions)
+        self.rcpt_per_session = config.get('EMAIL_SMTP_RCPT_PER_SESSION', self.rcpt_per_session)
+        self.greylist_retries = config.get('EMAIL_SMTP_GREYLIST_RETRIES', self.greylist_retries)
+        self.greylist_delay = config.get('EMAIL_SMTP_GREYLIST_DELAY', self.greylist_delay)
+        self.idle_timeout = config.get('EMAIL_SMTP_IDLE_SECONDS', self.idle_timeout)
+    
+    def probe(self, emails):
+        """
+        Verifica os emails por RCPT TO (uma passagem, sem esperas)
+    
+        Returns:
+            tuple: ({email: (is_valid, reason)} só para respostas definitivas,
+            [emails com resposta 4xx, a repetir mais tarde])
+        """
+        emails = list(dict.fromkeys(emails))
+        if not emails:
+            return {}, []
+        return self._call(self._probe_all(emails))
+    
+    def retry_greylisted(self, emails, since=None):
+        """
+        Repete os emails com greylisting até greylist_retries vezes, cada uma
+        greylist_delay segundos depois da anterior (a 1ª conta desde `since`,
+        o time.monotonic() da última resposta 4xx)
+    
+        Returns:
+            dict: {email: (is_valid, reason)} só para respostas definitivas
+        """
+        verdicts = {}
+        pending = list(emails)
+        if since is None:
+            since = time.monotonic()
+        for _ in range(self.greylist_retries):
+            if not pending:
+                break
+            time.sleep(max(0, self.greylist_delay - (time.monotonic() - since)))
+            found, pending = self.probe(pending)
+            verdicts.update(found)
+            since = time.monotonic()
+        return verdicts
+    
+    def _call(self, coro):
+        """Corre a corrotina no event loop do prober (criado na 1ª chamada)"""
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name='smtp-probe', daemon=True).start()
+                asyncio.run_coroutine_threadsafe(self._close_idle(), self._loop)
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+    
+    def _pool(self, host):
+        # Só usado no event loop do prober (uma thread): não precisa de lock
+        pool = self._pools.get(host)
+        if pool is None:
+            pool = self._pools[host] = _HostPool(self, host)
+        return pool
+    
+    async def _close_idle(self):
+        """Fecha periodicamente as sessões paradas (os servidores acabam por cortá-las)"""
+        while True:
+            await asyncio.sleep(max(1, self.idle_timeout / 2))
+            for host, pool in list(self._pools.items()):
+                await pool.close_idle(self.idle_timeout)
+                if not pool.idle and not pool.clients:
+                    del self._pools[host]
+    
+    async def _mx_hosts(self, domains):
+        """{domínio: servidor MX} (ou o servidor fixo de EMAIL_SMTP_HOST)"""
+        if self.host:
+            return {domain: self.host for domain in domains}
+    
+        resolver = dns.asyncresolver.Resolver()
+    
+        async def best_mx(domain):
+            try:
+                answer = await dns_scheduler.call_async(lambda: resolver.resolve(domain, 'MX'))
+            except Exception:
+                return domain, None
+            records = sorted(answer, key=lambda record: record.preference)
+            return domain, str(records[0].exchange).rstrip('.') if records else None
+    
+        return dict(await asyncio.gather(*(best_mx(domain) for domain in domains)))
+    
+    async def _probe_all(self, emails):
+        by_domain = {}
+        for email in emails:
+            by_domain.setdefault(email.rsplit('@', 1)[-1].lower(), []).append(email)
+        hosts = await self._mx_hosts(list(by_domain))
+    
+        # Um grupo por servidor MX (domínios diferentes no mesmo MX partilham sessões)
+        by_host = {}
+        for domain, domain_emails in by_domain.items():
+            if hosts.get(domain):
+                by_host.setdefault(hosts[domain], []).extend(domain_emails)
+    
+        groups = await asyncio.gather(
+            *(self._probe_host(host, host_emails) for host, host_emails in by_host.items())
+        )
+        verdicts = {}
+        greylisted = []
+        for host, host_verdicts, host_greylisted in groups:
+            verdicts.update(host_verdicts)
+            greylisted += host_greylisted
+        return verdicts, greylisted
+    
+    async def _probe_host(self, host, emails):
+        """Sessões do pool deste servidor a consumir a fila de emails"""
+        pool = self._pool(host)
+        queue = deque(emails)
+        verdicts = {}
+        greylisted = []
+    
+        async def worker():
+            while queue:
+                try:
+                    session = await pool.acquire()
+                except CONNECTION_ERRORS:
+                    # Sem ligação: os restantes deste servidor ficam com o veredicto MX
+                    return
+                answered = 0
+                try:
+                    while queue:
+                        email = queue.popleft()
+                        code = await session.rcpt(email)
+                        answered += 1
+                        if 200 <= code < 300:
+                            verdicts[email] = (True, '—')
+                        elif code in NOT_FOUND_CODES:
+                            verdicts[email] = (False, MAILBOX_NOT_FOUND)
+                        elif 400 <= code < 500:
+                            greylisted.append(email)
+                except CONNECTION_ERRORS:
+                    await pool.release(session, reusable=False)
+                    if session.reused and not answered:
+                        # Sessão parada que o servidor já fechou: repete com outra
+                        queue.appendleft(email)
+                        continue
+                    return
+                except BaseException:
+                    await pool.release(session, reusable=False)
+                    raise
+                await pool.release(session)
+    
+        pool.clients += 1
+        try:
+            sessions = min(self.max_sessions, len(emails))
+            await asyncio.gather(*(worker() for _ in range(sessions)))
+        finally:
+            pool.clients -= 1
+        return host, verdicts, greylisted
+
+# Instância única (configurada no arranque da app, ver routes.py)
+smtp_prober = SmtpProber()
+
+class Greylisted:
+    """Emails com resposta 4xx ao longo de um trabalho, repetidos no fim"""
+    
+    def __init__(self):
+        self.emails = []
+        self.last_seen = None
+    
+    def add(self, emails):
+        if emails:
+            self.emails.extend(emails)
+            self.last_seen = time.monotonic()
+
+def probe_stage(results, emails, greylisted=None):
+    """
+    Depois de join_stage: aplica o veredicto SMTP às linhas válidas em `emails`.
+    Os emails com greylisting são repetidos já ou, se for dado um Greylisted,
+    juntados a ele (ficam com o veredicto MX até à repetição)
+    
+    Returns:
+        list: [(email, is_valid, is_duplicate, reason), ...]
+    """
+    candidates = [row[0] for row in results if row[1] and not row[2] and row[0] in emails]
+    if not smtp_prober.enabled or not candidates:
+        return results
+    
+    verdicts, deferred = smtp_prober.probe(candidates)
+    if greylisted is not None:
+        greylisted.add(deferred)
+    elif deferred:
+        verdicts.update(smtp_prober.retry_greylisted(deferred))
+    probed = []
+    for email, is_valid, is_duplicate, reason in results:
+        if not is_duplicate and email in verdicts:
+            is_valid, reason = verdicts[email]
+        probed.append((email, is_valid, is_duplicate, reason))
+    return probed
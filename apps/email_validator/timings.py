@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+Tempos e contadores por etapa de cada upload (EmailValidation.timings).
+
+Cada etapa é um dict com 'seconds' (tempo de relógio acumulado) e contadores:
+
+    upload     - gravação do ficheiro no pedido (com o hash dos bytes)
+    hash       - hash do conteúdo normalizado no worker, que também conta (rows)
+    count      - contagem de linhas no worker, sem o hash (rows)
+    parse      - leitura do ficheiro por blocos (rows)
+    syntax     - formato, descartáveis e duplicados (rows)
+    disposable - emails rejeitados como descartáveis (rows; o tempo conta em syntax)
+    memo       - linhas copiadas de uploads recentes (rows, ver memo.py)
+    dns        - resolve_stage (domains, cache_hits, db_hits, misses, timeouts, errors)
+    smtp       - verificação RCPT TO (rows; greylisted = repetidos no fim)
+    persist    - gravação dos resultados e commit (rows)
+    clone      - cópia dos resultados de um upload igual (rows)
+    total      - trabalho completo no worker
+"""
+import time
+from contextlib import contextmanager
+from .validator import is_transient, TIMEOUT_REASON
+
+STAGES = ('upload', 'hash', 'count', 'parse', 'syntax', 'disposable', 'memo', 'dns',
+          'smtp', 'persist', 'clone', 'total')
+
+class StageTimings:
+    """Acumula segundos e contadores por etapa"""
+    
+    def __init__(self, data=None):
+        self.data = {name: dict(entry) for name, entry in (data or {}).items()}
+    
+    @contextmanager
+    def stage(self, name, **counts):
+        """Mede o bloco `with` e soma-o à etapa"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start, **counts)
+    
+    def add(self, name, seconds=0, **counts):
+        entry = self.data.setdefault(name, {'seconds': 0})
+        entry['seconds'] += seconds
+        for key, value in counts.items():
+            entry[key] = entry.get(key, 0) + value
+    
+    def as_dict(self):
+        """Cópia para guardar em JSON (segundos arredondados ao ms)"""
+        return {
+            name: dict(entry, seconds=round(entry['seconds'], 3))
+            for name, entry in self.data.items()
+        }
+
+def dns_counts(stats, verdicts):
+    """Contadores da etapa dns a partir das estatísticas de resolve_stage"""
+    fresh = [verdicts[domain][1] for domain in stats.get('resolved', ())]
+    timeouts = sum(1 for reason in fresh if reason == TIMEOUT_REASON)
+    errors = sum(1 for reason in fresh if is_transient(reason)) - timeouts
+    return {
+        'domains': len(verdicts),
+        'cache_hits': stats.get('cache_hits', 0),
+        'db_hits': stats.get('db_hits', 0),
+        'misses': len(fresh),
+        'timeouts': timeouts,
+        'errors': errors
+    }
+
+def summarize(timings_list):
+    """
+    Soma as etapas de vários uploads (vista de admin)
+    
+    Returns:
+        dict: {etapa: {'seconds', 'uploads', contadores...}} pela ordem de STAGES
+    """
+    totals = {}
+    for timings in timings_list:
+        for name, entry in timings.items():
+            total = totals.setdefault(name, {'seconds': 0, 'uploads': 0})
+            total['uploads'] += 1
+            for key, value in entry.items():
+                total[key] = total.get(key, 0) + value
+    
+    ordered = {name: totals.pop(name) for name in STAGES if name in totals}
+    ordered.update(totals)
+    for entry in ordered.values():
+        entry['seconds'] = round(entry['seconds'], 3)
+    return ordered
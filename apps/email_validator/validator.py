@@ -1,60 +1,164 @@
 import re
 import dns.resolver
 from datetime import datetime
+from .cache import domain_cache
+from .blocklist import DomainBlocklist
+from . import domain_store
+from .dns_scheduler import dns_scheduler
 
-# Lista de domínios temporários/descartáveis
+# Lista de domínios temporários/descartáveis (base, usada se não houver ficheiro)
 DISPOSABLE_DOMAINS = [
     'tempmail.com', 'guerrillamail.com', '10minutemail.com', 'throwaway.email',
     'mailinator.com', 'trashmail.com', 'temp-mail.org', 'fakeinbox.com',
     'maildrop.cc', 'yopmail.com', 'getnada.com', 'mohmal.com', 'sharklasers.com'
 ]
 
-def validate_email(email, check_mx=True):
+# Lista completa carregada de EMAIL_DISPOSABLE_FILE (ver blocklist.py);
+# também bloqueia subdomínios (x.mailinator.com)
+disposable_domains = DomainBlocklist(fallback=DISPOSABLE_DOMAINS)
+
+# Formato básico (pré-compilado); os grupos separam local e domínio
+EMAIL_RE = re.compile(r'^([a-zA-Z0-9._%+-]+)@([a-zA-Z0-9.-]+\.[a-zA-Z]{2,})$')
+
+# Razões usadas fora deste módulo (contadores em timings.py)
+DISPOSABLE_REASON = 'Email descartável/temporário'
+TIMEOUT_REASON = 'Timeout ao verificar DNS'
+DNS_ERROR_PREFIX = 'Erro ao verificar DNS'
+
+def check_syntax(email, blocked=None):
     """
-    Valida um email - CÓDIGO EXATO DO ORIGINAL
-    
+    Verificações locais (formato e descartáveis), sem DNS. Num lote, passar o
+    mesmo dict blocked a todas as chamadas: guarda o resultado da lista de
+    descartáveis por domínio, que é consultada uma só vez por domínio distinto
+
     Returns:
-        tuple: (is_valid, reason)
+        tuple: (is_valid, reason, domain) - domain é None se inválido
     """
     email = email.strip().lower()
-    
-    # 1. Validar formato básico
-    email_pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    if not re.match(email_pattern, email):
-        return False, 'Formato inválido'
-    
-    # 2. Extrair domínio
-    try:
-        domain = email.split('@')[1]
-    except IndexError:
-        return False, 'Formato inválido'
-    
+
+    # 1. Validar formato básico (e 2. extrair domínio)
+    match = EMAIL_RE.match(email)
+    if not match:
+        return False, 'Formato inválido', None
+    local, domain = match.groups()
+
     # 3. Verificar caracteres inválidos
     if '..' in email:
-        return False, 'Uso de acentos inválido'
-    
-    local = email.split('@')[0]
+        return False, 'Uso de acentos inválido', None
+
     if local.startswith('.') or local.endswith('.'):
-        return False, 'Formato de local inválido'
-    
+        return False, 'Formato de local inválido', None
+
     # 4. Verificar se é email descartável
-    if domain in DISPOSABLE_DOMAINS:
-        return False, 'Email descartável/temporário'
-    
+    if blocked is None:
+        disposable = domain in disposable_domains
+    else:
+        disposable = blocked.get(domain)
+        if disposable is None:
+            disposable = blocked[domain] = domain in disposable_domains
+    if disposable:
+        return False, DISPOSABLE_REASON, None
+
+    return True, '—', domain
+
+def mx_verdict(mx_records=None, error=None):
+    """
+    Converte o resultado de uma consulta MX (ou a exceção) em (is_valid, reason)
+    """
+    if error is None:
+        if not mx_records:
+            return False, 'Sem registos MX'
+        return True, '—'
+    if isinstance(error, dns.resolver.NXDOMAIN):
+        return False, 'Domínio não existe'
+    if isinstance(error, dns.resolver.NoAnswer):
+        return False, 'Domínio válido mas não registado'
+    if isinstance(error, dns.resolver.Timeout):
+        return False, TIMEOUT_REASON
+    # Razões fixas (sem o texto da exceção): ver EmailReason.KNOWN
+    if isinstance(error, dns.resolver.NoNameservers):
+        return False, DNS_ERROR_PREFIX + ': sem servidores de nomes'
+    return False, DNS_ERROR_PREFIX
+
+def is_transient(reason):
+    """Razões de falhas temporárias de DNS (devem ser verificadas de novo)"""
+    return bool(reason) and (
+        reason == TIMEOUT_REASON or reason.startswith(DNS_ERROR_PREFIX)
+    )
+
+def query_mx(domain):
+    """
+    Consulta DNS (bloqueante) dos registos MX, sem caches
+
+    Returns:
+        tuple: ((is_valid, reason), ttl em segundos)
+    """
+    try:
+        mx_records = dns_scheduler.call(lambda: dns.resolver.resolve(domain, 'MX'))
+    except Exception as e:
+        return mx_verdict(error=e), domain_cache.ttl_for(error=e)
+    return mx_verdict(mx_records), domain_cache.ttl_for(mx_records)
+
+def resolve_mx(domain):
+    """Veredicto MX de um domínio: domain_cache -> domain_checks (BD) -> DNS"""
+    verdict = domain_cache.get(domain)
+    if verdict is not None:
+        return verdict
+
+    stored = domain_store.lookup([domain]).get(domain)
+    if stored is not None:
+        verdict, ttl = stored
+        domain_cache.set(domain, verdict, ttl)
+        return verdict
+
+    verdict, ttl = query_mx(domain)
+    domain_cache.set(domain, verdict, ttl)
+    domain_store.store({domain: (verdict, ttl)})
+    return verdict
+
+def validate_email(email, check_mx=True):
+    """
+    Valida um email: verificações locais (check_syntax, com a lista de
+    descartáveis de blocklist.py) e, com check_mx, o veredicto MX do domínio
+    (resolve_mx: cache, domain_checks e DNS pelo dns_scheduler)
+
+    Returns:
+        tuple: (is_valid, reason)
+    """
+    is_valid, reason, domain = check_syntax(email)
+    if not is_valid:
+        return False, reason
+
     # 5. Verificar MX records (se solicitado)
     if check_mx:
-        try:
-            mx_records = dns.resolver.resolve(domain, 'MX')
-            if not mx_records:
-                return False, 'Sem registos MX'
-            return True, '—'
-        except dns.resolver.NXDOMAIN:
-            return False, 'Domínio não existe'
-        except dns.resolver.NoAnswer:
-            return False, 'Domínio válido mas não registado'
-        except dns.resolver.Timeout:
-            return False, 'Timeout ao verificar DNS'
-        except Exception as e:
-            return False, f'Erro ao verificar DNS: {str(e)}'
-    
-    return True, '—'
\ No newline at end of file
+        return resolve_mx(domain)
+
+    return True, '—'
+
+def validate_many(emails, check_mx=True, concurrency=50):
+    """
+    Valida vários emails de uma vez - mesmos veredictos e razões que
+    validate_email, pela ordem de entrada (sem tratamento de duplicados).
+    Cada domínio distinto passa uma só vez pela lista de descartáveis e, com
+    check_mx, pela consulta MX (bulk.resolve_stage).
+
+    Returns:
+        list: [(is_valid, reason), ...]
+    """
+    results = []
+    pending = []  # (índice, domínio)
+    blocked = {}
+
+    for email in emails:
+        is_valid, reason, domain = check_syntax(email, blocked)
+        if is_valid and check_mx:
+            pending.append((len(results), domain))
+        results.append((is_valid, reason))
+
+    if pending:
+        from .bulk import resolve_stage
+        verdicts = resolve_stage({domain for _, domain in pending}, concurrency)
+        for index, domain in pending:
+            results[index] = verdicts[domain]
+
+    return results
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+Arquiva validações antigas (ver apps/email_validator/archive.py).
+
+Passa os resultados das validações com mais de EMAIL_ARCHIVE_AFTER_DAYS dias
+para ficheiros .ndjson.gz em EMAIL_ARCHIVE_FOLDER. Pensado para correr
+periodicamente, na mesma máquina (ou disco) do servidor web: é de lá que
+api_upload_details e as exportações leem os ficheiros. Um serviço separado
+(ex.: cron job no Render) tem o seu próprio disco e não serve, e a pasta tem
+de estar num disco persistente (ver render.yaml): sem EMAIL_ARCHIVE_FOLDER
+configurado, não arquiva. Uso:
+
+    python archive_validations.py [dias]
+"""
+import sys
+from app import app
+from apps.email_validator.archive import archive_old, release_stale, purge_archived
+
+def archive_validations(days=None):
+    if not app.config.get('EMAIL_ARCHIVE_FOLDER'):
+        raise SystemExit('❌ EMAIL_ARCHIVE_FOLDER não configurado (pasta num disco persistente)')
+    
+    with app.app_context():
+        if days is None:
+            days = app.config.get('EMAIL_ARCHIVE_AFTER_DAYS', 90)
+        
+        released = release_stale(app.config.get('EMAIL_ARCHIVE_LEASE_HOURS', 6) * 3600)
+        if released:
+            print(f'⚠️ {released} validações com arquivo interrompido libertadas')
+        
+        purged = purge_archived(app.config.get('EMAIL_DELETE_CHUNK_SIZE', 5000))
+        if purged:
+            print(f'⚠️ {purged} resultados de validações já arquivadas apagados')
+        
+        archived = archive_old(
+            days,
+            app.config['EMAIL_ARCHIVE_FOLDER'],
+            chunk_size=app.config.get('EMAIL_DELETE_CHUNK_SIZE', 5000)
+        )
+        for validation_id, count in archived:
+            print(f'✅ Validação {validation_id} arquivada ({count} emails)')
+        print(f'✅ {len(archived)} validações arquivadas!')
+
+if __name__ == '__main__':
+    archive_validations(int(sys.argv[1]) if len(sys.argv) > 1 else None)
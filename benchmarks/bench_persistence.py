@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark: gravação de EmailResult via ORM vs persistence.save_results
+
+Usa a base de dados de DATABASE_URL (PostgreSQL -> COPY) ou, por omissão,
+um SQLite temporário (executemany). Uso:
+
+    python benchmarks/bench_persistence.py [nº de linhas]
+    DATABASE_URL=postgresql://... python benchmarks/bench_persistence.py 100000
+"""
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if not os.environ.get('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+from app import app
+from models import db, User, EmailValidation, EmailResult, EmailReason
+from migrate_db import upgrade_schema
+from apps.email_validator.persistence import save_results
+
+def make_results(n):
+    return [(f'user{i}@example{i % 100}.com', i % 3 != 0, False, '—') for i in range(n)]
+
+def new_validation(user):
+    validation = EmailValidation(user_id=user.id)
+    db.session.add(validation)
+    db.session.flush()
+    return validation
+
+def bench_orm(user, results):
+    validation = new_validation(user)
+    start = time.perf_counter()
+    for email, is_valid, is_duplicate, reason in results:
+        db.session.add(EmailResult(
+            validation_id=validation.id, email=email, is_valid=is_valid,
+            is_duplicate=is_duplicate, score=0, reason_code=EmailReason.code_for(reason)
+        ))
+    db.session.commit()
+    return time.perf_counter() - start, validation
+
+def bench_bulk(user, results):
+    validation = new_validation(user)
+    start = time.perf_counter()
+    save_results(validation.id, results)
+    db.session.commit()
+    return time.perf_counter() - start, validation
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    results = make_results(n)
+    
+    with app.app_context():
+        upgrade_schema(db)
+        user = User.query.filter_by(email='bench@myxapp.com').first()
+        if not user:
+            user = User(email='bench@myxapp.com', password_hash='-')
+            db.session.add(user)
+            db.session.commit()
+        
+        print(f'Backend: {db.engine.dialect.name} - {n} linhas')
+        for name, bench in (('ORM', bench_orm), ('save_results', bench_bulk)):
+            elapsed, validation = bench(user, results)
+            print(f'{name:>14}: {elapsed:7.2f}s  {n / elapsed:10.0f} linhas/s')
+            db.session.delete(validation)
+            db.session.commit()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark: validate_email (um email por chamada) vs validate_many (lote),
+apenas verificações locais (check_mx=False), com a lista de descartáveis de
+EMAIL_DISPOSABLE_FILE (índice mmap, como em produção). Uso:
+
+    python benchmarks/bench_validator.py [nº de emails]
+"""
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from apps.email_validator.validator import validate_email, validate_many, disposable_domains
+
+def make_emails(n):
+    random.seed(42)
+    domains = ['gmail.com', 'hotmail.com', 'empresa.pt', 'mailinator.com', 'sapo.pt']
+    emails = []
+    for i in range(n):
+        kind = i % 10
+        if kind == 0:
+            emails.append(f'invalido{i}')
+        elif kind == 1:
+            emails.append(f'a..b{i}@gmail.com')
+        else:
+            emails.append(f'User.{i}@{random.choice(domains)}')
+    return emails
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    emails = make_emails(n)
+    disposable_domains.configure(Config.EMAIL_DISPOSABLE_FILE)
+    
+    start = time.perf_counter()
+    single = [validate_email(email, False) for email in emails]
+    single_time = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    many = validate_many(emails, check_mx=False)
+    many_time = time.perf_counter() - start
+    
+    assert single == many, 'Veredictos diferentes!'
+    
+    print(f'{n} emails (check_mx=False)')
+    print(f'validate_email: {single_time:6.2f}s  {n / single_time * 60:12.0f} emails/min')
+    print(f' validate_many: {many_time:6.2f}s  {n / many_time * 60:12.0f} emails/min')
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,86 @@
 import os
 from datetime import timedelta
 
+basedir = os.path.abspath(os.path.dirname(__file__))
+
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///myxapp.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    PERMANENT_SESSION_LIFETIME = timedelta(days=7)
\ No newline at end of file
+    PERMANENT_SESSION_LIFETIME = timedelta(days=7)
+
+    # Email Validator - nº máximo de consultas MX em simultâneo (uploads)
+    EMAIL_DNS_CONCURRENCY = int(os.environ.get('EMAIL_DNS_CONCURRENCY', 50))
+
+    # Limites globais de DNS (por processo): consultas em curso, consultas
+    # por segundo e novas tentativas com backoff (segundos) em timeouts
+    EMAIL_DNS_MAX_IN_FLIGHT = int(os.environ.get('EMAIL_DNS_MAX_IN_FLIGHT', 100))
+    EMAIL_DNS_QPS = float(os.environ.get('EMAIL_DNS_QPS', 200))
+    EMAIL_DNS_RETRIES = 2
+    EMAIL_DNS_RETRY_BACKOFF = 0.5
+
+    # Cache de veredictos MX por domínio (segundos)
+    EMAIL_DNS_CACHE_SIZE = int(os.environ.get('EMAIL_DNS_CACHE_SIZE', 100000))
+    EMAIL_DNS_CACHE_MIN_TTL = 60
+    EMAIL_DNS_CACHE_MAX_TTL = 86400
+    EMAIL_DNS_NEGATIVE_TTL = 900
+    EMAIL_DNS_ERROR_TTL = 30
+
+    # Verificação da caixa de correio por SMTP (RCPT TO) nos uploads, depois
+    # do MX; desligada por omissão. EMAIL_SMTP_HOST força um servidor fixo
+    # (ex.: aiosmtpd local para testes) em vez do MX de cada domínio
+    EMAIL_SMTP_PROBE = os.environ.get('EMAIL_SMTP_PROBE', 'false').lower() == 'true'
+    EMAIL_SMTP_HOST = os.environ.get('EMAIL_SMTP_HOST')
+    EMAIL_SMTP_PORT = int(os.environ.get('EMAIL_SMTP_PORT', 25))
+    EMAIL_SMTP_HELO = os.environ.get('EMAIL_SMTP_HELO', 'myxapp.local')
+    EMAIL_SMTP_MAIL_FROM = os.environ.get('EMAIL_SMTP_MAIL_FROM', 'verify@myxapp.local')
+    EMAIL_SMTP_TIMEOUT = 10
+    # Ligações por servidor MX em todo o processo, reutilizadas entre blocos
+    # e trabalhos; fechadas ao fim de EMAIL_SMTP_IDLE_SECONDS sem uso
+    EMAIL_SMTP_MAX_SESSIONS_PER_HOST = 2
+    EMAIL_SMTP_IDLE_SECONDS = 30
+    EMAIL_SMTP_RCPT_PER_SESSION = 100
+    EMAIL_SMTP_GREYLIST_RETRIES = 2
+    EMAIL_SMTP_GREYLIST_DELAY = 30
+
+    # Uploads em massa processados em background
+    EMAIL_UPLOAD_FOLDER = os.environ.get('EMAIL_UPLOAD_FOLDER') or os.path.join(basedir, 'uploads')
+    EMAIL_JOB_WORKERS = int(os.environ.get('EMAIL_JOB_WORKERS', 2))
+    EMAIL_JOB_CHUNK_SIZE = 1000
+    # Trabalhos 'running' sem heartbeat há mais do que isto voltam à fila
+    # (worker morto ou redeploy a meio); verificado no arranque e a cada
+    # EMAIL_JOB_SWEEP_SECONDS
+    EMAIL_JOB_LEASE_SECONDS = 600
+    EMAIL_JOB_SWEEP_SECONDS = 60
+
+    # Reenvio do mesmo ficheiro (mesmo conteúdo e checkMX) nas últimas N
+    # horas: devolve o upload existente ou copia os resultados (0 = desligado)
+    EMAIL_DEDUP_WINDOW_HOURS = int(os.environ.get('EMAIL_DEDUP_WINDOW_HOURS', 24))
+
+    # Eliminação: até N resultados apaga no pedido (ON DELETE CASCADE); acima
+    # disso apaga em background, por blocos de EMAIL_DELETE_CHUNK_SIZE linhas
+    EMAIL_DELETE_SYNC_MAX = int(os.environ.get('EMAIL_DELETE_SYNC_MAX', 10000))
+    EMAIL_DELETE_CHUNK_SIZE = 5000
+
+    # Arquivo: validações com mais de N dias passam para ficheiros .ndjson.gz
+    # (python archive_validations.py); 0 = desligado. A pasta tem de estar
+    # num disco persistente (no Render, um disk; o disco do serviço é apagado
+    # em cada deploy): sem EMAIL_ARCHIVE_FOLDER definido não se arquiva
+    EMAIL_ARCHIVE_FOLDER = os.environ.get('EMAIL_ARCHIVE_FOLDER')
+    EMAIL_ARCHIVE_AFTER_DAYS = int(os.environ.get('EMAIL_ARCHIVE_AFTER_DAYS', 90))
+    # Validações presas em 'archiving' há mais de N horas (arquivo interrompido)
+    # são libertadas na execução seguinte
+    EMAIL_ARCHIVE_LEASE_HOURS = 6
+
+    # Reutilizar veredictos de uploads dos últimos N dias (0 = desligado)
+    EMAIL_MEMO_MAX_AGE_DAYS = int(os.environ.get('EMAIL_MEMO_MAX_AGE_DAYS', 7))
+
+    # Progresso em SSE: intervalo entre leituras e duração máxima de cada
+    # ligação (cada uma ocupa uma das threads do worker gthread do gunicorn)
+    EMAIL_SSE_INTERVAL = 1
+    EMAIL_SSE_MAX_SECONDS = 20
+
+    # Lista de domínios descartáveis (um por linha; recarregada se mudar)
+    EMAIL_DISPOSABLE_FILE = os.environ.get('EMAIL_DISPOSABLE_FILE') or \
+        os.path.join(basedir, 'apps', 'email_validator', 'data', 'disposable_domains.txt')
+    EMAIL_DISPOSABLE_RELOAD_INTERVAL = 30
@@ -1,6 +1,11 @@
 # -*- coding: utf-8 -*-
-from flask import Blueprint, render_template, redirect, url_for, flash, request, session
-from models import db, User, App, Permission
+from flask import Blueprint, render_template, redirect, url_for, flash, request, session, current_app
+from sqlalchemy.orm import joinedload
+from models import db, User, App, Permission, EmailValidation
+from apps.email_validator.deletion import delete_user as delete_user_data
+from apps.email_validator.timings import STAGES, summarize
+from apps.email_validator.cache import domain_cache
+from apps.email_validator import jobs
 from functools import wraps
 
 admin_bp = Blueprint('admin', __name__)
@@ -36,6 +41,27 @@ def dashboard():
                          active_users=active_users,
                          recent_users=recent_users)
 
+@admin_bp.route('/email-timings')
+@admin_required
+def email_timings():
+    """Tempos por etapa dos uploads recentes e estado da cache MX deste worker"""
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+    
+    # O template mostra o email do utilizador de cada linha: carregar no mesmo SELECT
+    validations = EmailValidation.query.options(
+        joinedload(EmailValidation.user)
+    ).filter(
+        EmailValidation.stage_timings.isnot(None),
+        EmailValidation.status != 'deleting'
+    ).order_by(EmailValidation.id.desc()).limit(limit).all()
+    
+    return render_template('admin/email_timings.html',
+                         validations=validations,
+                         summary=summarize(v.timings for v in validations),
+                         stages=STAGES,
+                         cache=domain_cache.stats(),
+                         limit=limit)
+
 @admin_bp.route('/users')
 @admin_required
 def users():
@@ -87,6 +113,10 @@ def toggle_user_active(user_id):
         flash('Não pode desativar a sua própria conta.', 'danger')
         return redirect(url_for('admin.users'))
     
+    if user.pending_delete:
+        flash(f'Utilizador {user.email} está a ser apagado.', 'danger')
+        return redirect(url_for('admin.users'))
+    
     user.is_active = not user.is_active
     db.session.commit()
     
@@ -108,8 +138,28 @@ def delete_user(user_id):
         flash('Não pode apagar a sua própria conta.', 'danger')
         return redirect(url_for('admin.users'))
     
-    db.session.delete(user)
-    db.session.commit()
+    if user.pending_delete:
+        flash(f'Utilizador {user.email} já está a ser apagado.', 'warning')
+        return redirect(url_for('admin.users'))
+    
+    busy = EmailValidation.query.filter(
+        EmailValidation.user_id == user.id,
+        EmailValidation.status.in_(('queued', 'running', 'archiving'))
+    ).first()
+    if busy:
+        flash(f'Utilizador {user.email} tem validações em processamento.', 'danger')
+        return redirect(url_for('admin.users'))
+    
+    # Filhos apagados pela BD (ON DELETE CASCADE); com muitos resultados,
+    # o utilizador é desativado e apagado em background
+    email = user.email
+    deleted, validation_ids = delete_user_data(
+        user, current_app.config.get('EMAIL_DELETE_SYNC_MAX', 10000)
+    )
+    if not deleted:
+        jobs.submit_delete(validation_ids, user_id=user_id)
+        flash(f'Utilizador {email} desativado; os dados estão a ser apagados em background.', 'success')
+        return redirect(url_for('admin.users'))
     
-    flash(f'Utilizador {user.email} foi apagado.', 'success')
+    flash(f'Utilizador {email} foi apagado.', 'success')
     return redirect(url_for('admin.users'))
\ No newline at end of file
@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+"""Configuração do gunicorn (ver render.yaml)"""
+
+def post_worker_init(worker):
+    """Cada worker do servidor web arranca a sua fila de uploads (jobs.start)"""
+    from app import app
+    from apps.email_validator import jobs
+    jobs.start(app)
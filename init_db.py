@@ -2,11 +2,12 @@
 """Script para inicializar base de dados no Render"""
 from app import app, db
 from models import User, App
+from migrate_db import upgrade_schema
 
 def init_database():
     with app.app_context():
         print("🔧 Criando tabelas...")
-        db.create_all()
+        upgrade_schema(db)
         
         # Criar apps
         if not App.query.filter_by(name='Email Validator').first():
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+Atualiza o esquema de uma base de dados existente (colunas e índices novos).
+
+db.create_all() só cria tabelas em falta; as colunas e índices acrescentados
+a tabelas que já existem são adicionados aqui, e os dados das colunas que
+deixaram de existir são convertidos antes de as remover. Seguro para correr
+várias vezes.
+"""
+from sqlalchemy import inspect, text, MetaData
+from sqlalchemy.schema import CreateTable, AddConstraint
+
+# Linhas por UPDATE na conversão de email_results
+BATCH_SIZE = 50000
+
+def upgrade_schema(db):
+    """Cria tabelas em falta e adiciona colunas/índices novos às existentes"""
+    db.create_all()
+    
+    engine = db.engine
+    inspector = inspect(engine)
+    compiler = engine.dialect.ddl_compiler(engine.dialect, None)
+    
+    for table in db.metadata.sorted_tables:
+        existing = {c['name'] for c in inspector.get_columns(table.name)}
+        
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            
+            # Inclui tipo, DEFAULT (server_default) e NOT NULL
+            ddl = f'ALTER TABLE {table.name} ADD COLUMN {compiler.get_column_specification(column)}'
+            
+            with engine.begin() as conn:
+                conn.execute(text(ddl))
+            print(f'✅ Coluna adicionada: {table.name}.{column.name}')
+        
+        existing_indexes = {i['name'] for i in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                index.create(engine)
+                print(f'✅ Índice criado: {index.name}')
+    
+    migrate_email_results(db)
+    backfill_email_hash(db)
+    upgrade_foreign_keys(db)
+
+def migrate_email_results(db):
+    """
+    email_results: reason (texto) -> reason_code (email_reasons); upload_date e
+    validation_type passam a ser os da EmailValidation. Remove as colunas antigas.
+    """
+    from models import EmailReason
+    
+    engine = db.engine
+    EmailReason.seed()
+    
+    existing = {c['name'] for c in inspect(engine).get_columns('email_results')}
+    if 'reason' not in existing:
+        return
+    
+    with engine.connect() as conn:
+        last_id = conn.execute(text('SELECT MAX(id) FROM email_results')).scalar() or 0
+    
+    # Razões fixas pelo texto; as dinâmicas antigas ('Erro ao verificar DNS:
+    # <exceção>') passam às genéricas, como em EmailReason.normalize
+    for start in range(0, last_id, BATCH_SIZE):
+        with engine.begin() as conn:
+            conn.execute(text(
+                'UPDATE email_results SET reason_code = COALESCE('
+                '(SELECT id FROM email_reasons WHERE email_reasons.text = email_results.reason '
+                'AND email_reasons.id < :first_dynamic), '
+                'CASE WHEN reason LIKE :dns_error THEN :dns_code ELSE :other_code END) '
+                'WHERE reason IS NOT NULL AND reason_code IS NULL AND id > :start AND id <= :end'
+            ), {
+                'start': start, 'end': start + BATCH_SIZE,
+                'first_dynamic': EmailReason.FIRST_DYNAMIC,
+                'dns_error': EmailReason.DNS_ERROR + '%',
+                'dns_code': EmailReason.KNOWN[EmailReason.DNS_ERROR],
+                'other_code': EmailReason.KNOWN[EmailReason.OTHER_ERROR]
+            })
+    print('✅ Razões convertidas: email_results')
+    
+    if 'validation_type' in existing:
+        with engine.begin() as conn:
+            conn.execute(text(
+                "UPDATE email_validations SET validation_type = 'single' WHERE id IN "
+                "(SELECT validation_id FROM email_results WHERE validation_type = 'single')"
+            ))
+    
+    for column in ('reason', 'upload_date', 'validation_type'):
+        if column in existing:
+            with engine.begin() as conn:
+                conn.execute(text(f'ALTER TABLE email_results DROP COLUMN {column}'))
+            print(f'✅ Coluna removida: email_results.{column}')
+
+def backfill_email_hash(db):
+    """
+    Preenche email_results.email_hash nas linhas anteriores à coluna, para os
+    uploads antigos também serem reutilizados (memo.py). Por blocos de
+    BATCH_SIZE linhas, cada um na sua transação.
+    """
+    from apps.email_validator.memo import email_hash
+    
+    engine = db.engine
+    last_id = 0
+    total = 0
+    
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(text(
+                'SELECT id, email FROM email_results '
+                'WHERE email_hash IS NULL AND id > :last_id ORDER BY id LIMIT :limit'
+            ), {'last_id': last_id, 'limit': BATCH_SIZE}).all()
+            if not rows:
+                break
+            conn.execute(
+                text('UPDATE email_results SET email_hash = :hash WHERE id = :id'),
+                [{'id': row.id, 'hash': email_hash(row.email)} for row in rows]
+            )
+        last_id = rows[-1].id
+        total += len(rows)
+    
+    if total:
+        print(f'✅ email_hash preenchido: {total} linhas de email_results')
+
+def _ondelete(value):
+    value = (value or '').upper()
+    return None if value in ('', 'NO ACTION') else value
+
+def upgrade_foreign_keys(db):
+    """
+    Cria as chaves estrangeiras em falta e acerta o ON DELETE das existentes
+    com o dos modelos.
+    PostgreSQL: recria a constraint. SQLite (não altera constraints): recria a
+    tabela e copia os dados, como recomendado na documentação do SQLite.
+    """
+    engine = db.engine
+    inspector = inspect(engine)
+    
+    for table in db.metadata.sorted_tables:
+        existing = {
+            tuple(fk['constrained_columns']): fk
+            for fk in inspector.get_foreign_keys(table.name)
+        }
+        changed = []
+        for constraint in table.foreign_key_constraints:
+            fk = existing.get(tuple(constraint.column_keys))
+            # Em falta (coluna acrescentada com ADD COLUMN) ou com outro ON DELETE
+            if fk is None or _ondelete(fk['options'].get('ondelete')) != _ondelete(constraint.ondelete):
+                changed.append((constraint, fk))
+        
+        if not changed:
+            continue
+        
+        if engine.dialect.name == 'sqlite':
+            columns = [c['name'] for c in inspector.get_columns(table.name)]
+            _rebuild_sqlite_table(engine, table, columns)
+        else:
+            with engine.begin() as conn:
+                for constraint, fk in changed:
+                    if fk is not None:
+                        conn.execute(text(f'ALTER TABLE {table.name} DROP CONSTRAINT {fk["name"]}'))
+                    conn.execute(AddConstraint(constraint))
+        print(f'✅ Chaves estrangeiras atualizadas: {table.name}')
+
+def _rebuild_sqlite_table(engine, table, existing_columns):
+    # Cópia da tabela com outro nome (as FKs continuam a apontar para as originais)
+    metadata = MetaData()
+    for other in table.metadata.sorted_tables:
+        other.to_metadata(metadata)
+    new_table = table.to_metadata(metadata, name=f'_new_{table.name}')
+    columns = ', '.join(c.name for c in table.columns if c.name in existing_columns)
+    
+    with engine.connect() as conn:
+        conn.exec_driver_sql('PRAGMA foreign_keys=OFF')
+        conn.commit()
+        with conn.begin():
+            conn.execute(CreateTable(new_table))
+            conn.exec_driver_sql(
+                f'INSERT INTO {new_table.name} ({columns}) SELECT {columns} FROM {table.name}'
+            )
+            conn.exec_driver_sql(f'DROP TABLE {table.name}')
+            conn.exec_driver_sql(f'ALTER TABLE {new_table.name} RENAME TO {table.name}')
+            for index in table.indexes:
+                index.create(conn)
+        conn.exec_driver_sql('PRAGMA foreign_keys=ON')
+        conn.commit()
+
+if __name__ == '__main__':
+    from app import app
+    from models import db
+    
+    with app.app_context():
+        upgrade_schema(db)
+        print('✅ Esquema atualizado!')
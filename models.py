@@ -2,11 +2,23 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
 from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import sqlite3
+import threading
 import json
 
 db = SQLAlchemy()
 bcrypt = Bcrypt()
 
+@event.listens_for(Engine, 'connect')
+def _sqlite_foreign_keys(dbapi_connection, connection_record):
+    """SQLite só aplica chaves estrangeiras (e ON DELETE CASCADE) com este PRAGMA"""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
 class User(db.Model):
     __tablename__ = 'users'
     
@@ -16,9 +28,14 @@ class User(db.Model):
     role = db.Column(db.String(20), default='user')
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    referred_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    referred_by = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='SET NULL'), nullable=True)
+    
+    # Desativado e à espera de ser apagado em background (ver deletion.py)
+    pending_delete = db.Column(db.Boolean, default=False, server_default=db.false())
     
-    permissions = db.relationship('Permission', backref='user', lazy=True, cascade='all, delete-orphan')
+    # Filhos apagados pela BD (ON DELETE CASCADE), sem os carregar
+    permissions = db.relationship('Permission', backref='user', lazy=True,
+                                  cascade='all, delete-orphan', passive_deletes=True)
     
     def set_password(self, password):
         self.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
@@ -42,7 +59,8 @@ class App(db.Model):
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    permissions = db.relationship('Permission', backref='app', lazy=True, cascade='all, delete-orphan')
+    permissions = db.relationship('Permission', backref='app', lazy=True,
+                                  cascade='all, delete-orphan', passive_deletes=True)
     
     def __repr__(self):
         return f'<App {self.name}>'
@@ -51,8 +69,8 @@ class Permission(db.Model):
     __tablename__ = 'permissions'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    app_id = db.Column(db.Integer, db.ForeignKey('apps.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    app_id = db.Column(db.Integer, db.ForeignKey('apps.id', ondelete='CASCADE'), nullable=False)
     granted_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     __table_args__ = (db.UniqueConstraint('user_id', 'app_id', name='unique_user_app'),)
@@ -69,36 +87,140 @@ class EmailValidation(db.Model):
     __tablename__ = 'email_validations'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     upload_date = db.Column(db.DateTime, default=datetime.utcnow)
     
-    # Relationship com emails individuais
-    emails = db.relationship('EmailResult', backref='validation', lazy=True, cascade='all, delete-orphan')
-    
-    user = db.relationship('User', backref=db.backref('email_validations', lazy=True))
+    # Histórico paginado por utilizador (api_history) e uploads repetidos
+    __table_args__ = (
+        db.Index('ix_email_validations_user_date', 'user_id', 'upload_date', 'id'),
+        db.Index('ix_email_validations_content_hash', 'content_hash', 'upload_date'),
+    )
+    
+    # Processamento em background (uploads): queued, running, done, failed
+    # (e deleting enquanto os resultados são apagados, ver deletion.py)
+    status = db.Column(db.String(20), default='done', server_default='done')
+    job_type = db.Column(db.String(20), default='upload', server_default='upload')  # 'upload', 'revalidate' ou 'clone'
+    check_mx = db.Column(db.Boolean, default=True)
+    validation_type = db.Column(db.String(20), default='bulk', server_default='bulk')  # 'single' ou 'bulk'
+    source_path = db.Column(db.String(500))
+    total_rows = db.Column(db.Integer)
+    processed_count = db.Column(db.Integer, default=0, server_default='0')
+    error = db.Column(db.Text)
+    finished_at = db.Column(db.DateTime)
+    
+    # Atualizado pelo worker a cada bloco; um 'running' sem heartbeat há mais
+    # de EMAIL_JOB_LEASE_SECONDS é de um worker que morreu (ver jobs.py)
+    heartbeat_at = db.Column(db.DateTime)
+    
+    # sha256 dos bytes enviados (no pedido, readers.save_upload), do conteúdo
+    # normalizado + checkMX (no worker, readers.content_hash) e validação de
+    # onde os resultados foram copiados (job_type='clone')
+    file_hash = db.Column(db.String(64))
+    content_hash = db.Column(db.String(64))
+    cloned_from = db.Column(db.Integer, db.ForeignKey('email_validations.id', ondelete='SET NULL'))
+    
+    # Contadores agregados (preenchidos no processamento; NULL = por calcular)
+    count_total = db.Column(db.Integer)
+    count_valid = db.Column(db.Integer)
+    count_invalid = db.Column(db.Integer)
+    count_duplicate = db.Column(db.Integer)
+    
+    # Linhas copiadas de uploads anteriores vs validadas de novo
+    memo_count = db.Column(db.Integer, default=0, server_default='0')
+    fresh_count = db.Column(db.Integer, default=0, server_default='0')
+    
+    # Arquivo: resultados num .ndjson.gz (ver archive.py); fica só esta linha
+    archived_at = db.Column(db.DateTime)
+    archive_path = db.Column(db.String(500))
+    
+    # Tempos e contadores por etapa do processamento, em JSON (ver timings.py)
+    stage_timings = db.Column(db.Text)
+    
+    # Relationship com emails individuais (apagados pela BD)
+    emails = db.relationship('EmailResult', backref='validation', lazy=True,
+                             cascade='all, delete-orphan', passive_deletes=True)
+    
+    user = db.relationship('User', backref=db.backref(
+        'email_validations', lazy=True, cascade='all, delete-orphan', passive_deletes=True))
     
     @property
     def total_emails(self):
-        return len(self.emails)
+        return self.counters()['total']
     
     @property
     def valid_count(self):
-        return sum(1 for e in self.emails if e.is_valid and not e.is_duplicate)
+        return self.counters()['valid']
     
     @property
     def invalid_count(self):
-        return sum(1 for e in self.emails if not e.is_valid and not e.is_duplicate)
+        return self.counters()['invalid']
     
     @property
     def duplicate_count(self):
-        return sum(1 for e in self.emails if e.is_duplicate)
+        return self.counters()['duplicate']
     
     def get_success_rate(self):
-        non_duplicates = [e for e in self.emails if not e.is_duplicate]
+        counters = self.counters()
+        non_duplicates = counters['valid'] + counters['invalid']
         if not non_duplicates:
             return 0
-        valid = sum(1 for e in non_duplicates if e.is_valid)
-        return round((valid / len(non_duplicates)) * 100, 2)
+        return round((counters['valid'] / non_duplicates) * 100, 2)
+    
+    @property
+    def is_archived(self):
+        return self.archived_at is not None
+    
+    def heartbeat(self):
+        self.heartbeat_at = datetime.utcnow()
+    
+    @property
+    def timings(self):
+        return json.loads(self.stage_timings) if self.stage_timings else {}
+    
+    @timings.setter
+    def timings(self, value):
+        self.stage_timings = json.dumps(value) if value else None
+    
+    def counters(self):
+        """Contadores guardados; se ainda não existirem, calcula-os em SQL"""
+        if self.count_total is None:
+            self.refresh_counters()
+        return {
+            'total': self.count_total,
+            'valid': self.count_valid,
+            'invalid': self.count_invalid,
+            'duplicate': self.count_duplicate
+        }
+    
+    def refresh_counters(self):
+        """Recalcula os contadores com um único GROUP BY (sem carregar emails)"""
+        rows = db.session.query(
+            EmailResult.is_valid, EmailResult.is_duplicate, db.func.count(EmailResult.id)
+        ).filter(EmailResult.validation_id == self.id)\
+         .group_by(EmailResult.is_valid, EmailResult.is_duplicate).all()
+        
+        self.count_total = self.count_valid = self.count_invalid = self.count_duplicate = 0
+        for is_valid, is_duplicate, count in rows:
+            self.count_total += count
+            if is_duplicate:
+                self.count_duplicate += count
+            elif is_valid:
+                self.count_valid += count
+            else:
+                self.count_invalid += count
+    
+    def add_counts(self, results):
+        """Soma aos contadores um bloco de resultados (email, is_valid, is_duplicate, reason)"""
+        if self.count_total is None:
+            self.count_total = self.count_valid = self.count_invalid = self.count_duplicate = 0
+        for _, is_valid, is_duplicate, _ in results:
+            self.count_total += 1
+            if is_duplicate:
+                self.count_duplicate += 1
+            elif is_valid:
+                self.count_valid += 1
+            else:
+                self.count_invalid += 1
     
     def __repr__(self):
         return f'<EmailValidation {self.id} - User:{self.user_id}>'
@@ -108,23 +230,143 @@ class EmailResult(db.Model):
     __tablename__ = 'email_results'
     
     id = db.Column(db.Integer, primary_key=True)
-    validation_id = db.Column(db.Integer, db.ForeignKey('email_validations.id'), nullable=False)
+    validation_id = db.Column(db.Integer, db.ForeignKey('email_validations.id', ondelete='CASCADE'), nullable=False)
     
     # Dados do email
     email = db.Column(db.String(255), nullable=False)
-    upload_date = db.Column(db.DateTime, default=datetime.utcnow)
+    email_hash = db.Column(db.BigInteger, index=True)  # ver memo.email_hash
     
-    # Resultado da validação
+    # Resultado da validação (razão codificada, ver EmailReason)
     is_valid = db.Column(db.Boolean, default=False)
     is_duplicate = db.Column(db.Boolean, default=False)
     score = db.Column(db.Integer, default=0)
-    reason = db.Column(db.String(500))
+    reason_code = db.Column(db.Integer)
+    
+    # Paginação por id dentro de cada validação (todos / válidos / inválidos)
+    __table_args__ = (
+        db.Index('ix_email_results_validation_id', 'validation_id', 'id'),
+        db.Index('ix_email_results_validation_status', 'validation_id', 'is_duplicate', 'is_valid', 'id'),
+    )
     
-    # Tipo de validação
-    validation_type = db.Column(db.String(20), default='bulk')  # 'single' ou 'bulk'
+    @property
+    def reason(self):
+        return EmailReason.text_for(self.reason_code)
+    
+    # Iguais para todas as linhas de uma validação: lidos da EmailValidation
+    @property
+    def upload_date(self):
+        return self.validation.upload_date
+    
+    @property
+    def validation_type(self):
+        return self.validation.validation_type
     
     def __repr__(self):
         return f'<EmailResult {self.email} - Valid:{self.is_valid}>'
+
+class EmailReason(db.Model):
+    """
+    Razões de validação (EmailResult.reason_code -> texto).
+    
+    Só há um conjunto fixo de razões (KNOWN): textos com partes variáveis (o
+    domínio, a resposta do servidor) passam à razão genérica correspondente
+    (normalize), por isso a tabela não cresce. Códigos >= FIRST_DYNAMIC são
+    de razões registadas por versões anteriores e só são lidos.
+    """
+    __tablename__ = 'email_reasons'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    text = db.Column(db.String(500), unique=True, nullable=False)
+    
+    KNOWN = {
+        '—': 1,
+        'Formato inválido': 2,
+        'Uso de acentos inválido': 3,
+        'Formato de local inválido': 4,
+        'Email descartável/temporário': 5,
+        'Sem registos MX': 6,
+        'Domínio não existe': 7,
+        'Domínio válido mas não registado': 8,
+        'Timeout ao verificar DNS': 9,
+        'Duplicado': 10,
+        'Caixa de correio não existe': 11,
+        'Erro ao verificar DNS': 12,
+        'Erro ao verificar DNS: sem servidores de nomes': 13,
+        'Erro na verificação': 14,
+    }
+    DNS_ERROR = 'Erro ao verificar DNS'
+    OTHER_ERROR = 'Erro na verificação'
+    FIRST_DYNAMIC = 100
+    
+    _texts = {code: text for text, code in KNOWN.items()}
+    _lock = threading.Lock()
+    
+    @classmethod
+    def normalize(cls, text):
+        """Razão de KNOWN para um texto (os desconhecidos passam à genérica)"""
+        if text in cls.KNOWN:
+            return text
+        if text.startswith(cls.DNS_ERROR):
+            return cls.DNS_ERROR
+        return cls.OTHER_ERROR
+    
+    @classmethod
+    def code_for(cls, text):
+        """Código da razão (sem escritas: só códigos de KNOWN)"""
+        if text is None:
+            return None
+        code = cls.KNOWN.get(text)
+        if code is None:
+            code = cls.KNOWN[cls.normalize(text)]
+        return code
+    
+    @classmethod
+    def text_for(cls, code):
+        if code is None:
+            return None
+        text = cls._texts.get(code)
+        if text is None:
+            cls._load()
+            text = cls._texts.get(code)
+        return text
+    
+    @classmethod
+    def seed(cls):
+        """Garante as razões fixas na tabela"""
+        table = cls.__table__
+        with db.engine.begin() as conn:
+            existing = set(conn.execute(db.select(table.c.id)).scalars())
+            missing = [{'id': code, 'text': text} for text, code in cls.KNOWN.items()
+                       if code not in existing]
+            if missing:
+                conn.execute(table.insert(), missing)
+    
+    @classmethod
+    def _load(cls):
+        table = cls.__table__
+        with db.engine.connect() as conn:
+            rows = conn.execute(db.select(table.c.id, table.c.text)).all()
+        with cls._lock:
+            for code, text in rows:
+                cls._texts[code] = text
+
+class DomainCheck(db.Model):
+    """Veredicto MX por domínio, partilhado entre workers, utilizadores e uploads"""
+    __tablename__ = 'domain_checks'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    domain = db.Column(db.String(255), unique=True, nullable=False)
+    
+    # Resultado da consulta MX
+    is_valid = db.Column(db.Boolean, default=False)
+    reason = db.Column(db.String(500))
+    
+    checked_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<DomainCheck {self.domain} - Valid:{self.is_valid}>'
+
 # ============================================
 # TABELAS DO TEXT TRANSFORMER
 # ============================================
@@ -134,7 +376,7 @@ class TextTransformation(db.Model):
     __tablename__ = 'text_transformations'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     
     # Tipo de transformação
     transformation_type = db.Column(db.String(50), nullable=False)
@@ -148,7 +390,8 @@ class TextTransformation(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relacionamento
-    user = db.relationship('User', backref=db.backref('text_transformations', lazy=True))
+    user = db.relationship('User', backref=db.backref(
+        'text_transformations', lazy=True, cascade='all, delete-orphan', passive_deletes=True))
     
     def __repr__(self):
         return f'<TextTransformation {self.id} - User:{self.user_id} Type:{self.transformation_type}>'
\ No newline at end of file
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+smtp_probe.SmtpProber contra um servidor SMTP local (aiosmtpd).
+
+    pip install -r requirements-dev.txt
+    python -m pytest tests
+"""
+import socket
+import pytest
+from aiosmtpd.controller import Controller
+from apps.email_validator.smtp_probe import SmtpProber, MAILBOX_NOT_FOUND
+
+class RcptHandler:
+    """250 para ok@, 550 para missing@, 450 na 1ª tentativa para grey@ e depois 250"""
+    
+    def __init__(self):
+        self.attempts = {}
+    
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        self.attempts[address] = self.attempts.get(address, 0) + 1
+        local = address.split('@', 1)[0]
+        if local == 'missing':
+            return '550 5.1.1 User unknown'
+        if local == 'grey' and self.attempts[address] == 1:
+            return '450 4.2.0 Greylisted, try again later'
+        envelope.rcpt_tos.append(address)
+        return '250 OK'
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+@pytest.fixture
+def smtp_server():
+    handler = RcptHandler()
+    controller = Controller(handler, hostname='127.0.0.1', port=_free_port())
+    controller.start()
+    yield controller, handler
+    controller.stop()
+
+@pytest.fixture
+def prober(smtp_server):
+    controller, _ = smtp_server
+    return SmtpProber(enabled=True, host=controller.hostname, port=controller.port,
+                      mail_from='verify@myxapp.local', timeout=5, max_sessions=2,
+                      greylist_retries=1, greylist_delay=0)
+
+def test_rcpt_accepted_and_rejected(prober):
+    verdicts, greylisted = prober.probe(['ok@example.com', 'missing@example.com'])
+    
+    assert verdicts == {
+        'ok@example.com': (True, '—'),
+        'missing@example.com': (False, MAILBOX_NOT_FOUND)
+    }
+    assert greylisted == []
+
+def test_greylisted_then_accepted(prober, smtp_server):
+    _, handler = smtp_server
+    
+    verdicts, greylisted = prober.probe(['grey@example.com'])
+    assert verdicts == {}
+    assert greylisted == ['grey@example.com']
+    
+    assert prober.retry_greylisted(greylisted) == {'grey@example.com': (True, '—')}
+    assert handler.attempts['grey@example.com'] == 2
+
+def test_sessions_reused_across_calls(prober):
+    for chunk in range(5):
+        emails = [f'ok{chunk}-{i}@example.com' for i in range(20)]
+        verdicts, _ = prober.probe(emails)
+        assert len(verdicts) == len(emails)
+    
+    assert prober.sessions <= prober.max_sessions